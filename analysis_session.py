@@ -0,0 +1,216 @@
+import logging
+import os
+
+import networkx as nx
+from centrality import CentralityEngine
+from churn_metrics import analyze_churn
+from churn_series import DEFAULT_CHURN_SERIES_DIR, ChurnSeries, build_churn_series
+from churn_store import ChurnStore
+from co_change import MAX_COMMIT_MODULES, analyze_co_change, coupling_records
+from exports import EXPORT_FORMATS, export_graph, write_jsonl
+from file_utils import EXCLUDED_DIRS, project_index
+from hierarchy_rollup import HierarchyRollup
+from incremental_graph import IncrementalGraph
+from compact_graph import CompactGraph
+from graph_builder import build_compact_dependency_graph, graph_centrality
+from module_view_builder import module_view_from_graph
+from module_view_builder2 import improved_module_view_from_graph
+from reachability import ReachabilityIndex, ReachabilityStore
+from rendering import FigureRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisSession:
+    """One analysis run over a code root.
+
+    The project index and the file-level dependency graph are built on first
+    use and then shared by every stage, so the tree is walked and parsed once
+    no matter how many reports are produced. Stages only return data unless
+    `render` asks for figures or `export_dir` for machine-readable files.
+    Figures are queued on `renderer` (a default FigureRenderer when None) and
+    drawn together by `render_figures`.
+    """
+
+    def __init__(
+        self,
+        code_root_folder: str,
+        cache_path: str | None = None,
+        excluded_dirs=EXCLUDED_DIRS,
+        jobs: int | None = 1,
+        match_policy: str = "package",
+        churn_store_path: str | None = None,
+        centrality_engine: CentralityEngine | None = None,
+        incremental: str | None = None,
+        scanner: str = "ast",
+        module_depth: int = 2,
+        render: bool = False,
+        export_dir: str | None = None,
+        export_formats=EXPORT_FORMATS,
+        layout_cache_path: str | None = None,
+        discovery: str = "walk",
+        renderer: FigureRenderer | None = None,
+    ):
+        self.code_root_folder = code_root_folder
+        self.cache_path = cache_path
+        self.excluded_dirs = excluded_dirs
+        self.jobs = jobs
+        self.match_policy = match_policy
+        self.churn_store_path = churn_store_path
+        self.centrality_engine = centrality_engine or CentralityEngine()
+        self.incremental = incremental
+        self.graph_delta = None
+        self.scanner = scanner
+        self.module_depth = module_depth
+        self.render = render
+        self.export_dir = export_dir
+        self.export_formats = export_formats
+        self.layout_cache_path = layout_cache_path
+        self.discovery = discovery
+        self.renderer = (renderer or FigureRenderer(layout_cache_path=layout_cache_path)) if render else None
+        self._graph = None
+        self._compact_graph = None
+        self._rollup = None
+        self._reachability = None
+        self._betweenness = None
+
+    @property
+    def index(self):
+        return project_index(self.code_root_folder, self.excluded_dirs, self.discovery)
+
+    @property
+    def compact_graph(self) -> CompactGraph:
+        """The file-level dependency graph in compact form, which every stage works on.
+
+        In incremental mode it is taken from the graph the incremental store keeps.
+        """
+        if self._compact_graph is None and self.incremental and self.cache_path:
+            self._compact_graph = CompactGraph.from_networkx(self.graph)
+        elif self._compact_graph is None:
+            self._compact_graph = build_compact_dependency_graph(self.code_root_folder, cache_path=self.cache_path, excluded_dirs=self.excluded_dirs, jobs=self.jobs, match_policy=self.match_policy, scanner=self.scanner, discovery=self.discovery)
+        return self._compact_graph
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        """The file-level dependency graph as a networkx DiGraph, built on first access for ad-hoc analysis."""
+        if self._graph is None and self.incremental and self.cache_path:
+            with IncrementalGraph(self.code_root_folder, self.cache_path, excluded_dirs=self.excluded_dirs, jobs=self.jobs, match_policy=self.match_policy, scanner=self.scanner, discovery=self.discovery) as store:
+                self.graph_delta = store.update(self.incremental)
+                self._graph = store.graph
+        elif self._graph is None:
+            self._graph = self.compact_graph.to_networkx()
+        return self._graph
+
+    @property
+    def rollup(self) -> HierarchyRollup:
+        """Module graphs at every package depth, aggregated from the file graph in one pass."""
+        if self._rollup is None:
+            self._rollup = HierarchyRollup(self.compact_graph)
+        return self._rollup
+
+    @property
+    def reachability(self) -> ReachabilityIndex:
+        """Transitive dependency index of the file graph, kept in the import cache between runs when there is one."""
+        if self._reachability is None and self.cache_path:
+            with ReachabilityStore(self.cache_path) as store:
+                self._reachability = store.index(self.compact_graph)
+        elif self._reachability is None:
+            self._reachability = ReachabilityIndex.build(self.compact_graph)
+        return self._reachability
+
+    def _export_graph(self, G, name):
+        if self.export_dir:
+            export_graph(G, self.export_dir, name, self.export_formats)
+
+    def _export_records(self, records, name):
+        if self.export_dir:
+            os.makedirs(self.export_dir, exist_ok=True)
+            path = os.path.join(self.export_dir, f"{name}.jsonl")
+            logger.info(f"Exported {write_jsonl(records, path)} '{name}' records to {path}.")
+
+    def render_figures(self) -> dict:
+        """Draw every figure queued by the stages so far; returns `{figure: [paths]}`."""
+        if self.renderer is None:
+            return {}
+        return self.renderer.render()
+
+    @property
+    def betweenness(self) -> dict:
+        """Betweenness of every file, computed once and shared by the centrality stage and the figures."""
+        if self._betweenness is None:
+            self._betweenness = self.centrality_engine.betweenness(self.compact_graph)
+        return self._betweenness
+
+    def dependency_graph(self) -> CompactGraph:
+        if self.renderer is not None:
+            self.renderer.submit("dependency_graph", self.compact_graph, scores=self.betweenness)
+        self._export_graph(self.compact_graph, "dependency_graph")
+        return self.compact_graph
+
+    def centrality(self, top_n):
+        in_degree, out_degree, betweenness = graph_centrality(self.compact_graph, top_n, engine=self.centrality_engine, renderer=self.renderer, betweenness=self.betweenness)
+        self._export_records(
+            ({"module": node, "in_degree": in_degree.get(node, 0), "out_degree": out_degree.get(node, 0), "betweenness": betweenness.get(node, 0.0)} for node in sorted(self.compact_graph)),
+            "centrality",
+        )
+        return in_degree, out_degree, betweenness
+
+    def module_view(self) -> nx.DiGraph:
+        module_graph = module_view_from_graph(self.compact_graph, engine=self.centrality_engine, depth=self.module_depth, rollup=self.rollup, renderer=self.renderer)
+        self._export_graph(module_graph, "module_graph")
+        return module_graph
+
+    def improved_module_view(self) -> nx.DiGraph:
+        module_graph = improved_module_view_from_graph(self.compact_graph, engine=self.centrality_engine, depth=self.module_depth, rollup=self.rollup, renderer=self.renderer)
+        self._export_graph(module_graph, "improved_module_graph")
+        return module_graph
+
+    def churn(self, since_date):
+        if self.churn_store_path is None:
+            module_churn = analyze_churn(self.code_root_folder, since_date, index=self.index, renderer=self.renderer)
+        else:
+            with ChurnStore(self.churn_store_path) as store:
+                module_churn = analyze_churn(self.code_root_folder, since_date, index=self.index, store=store, renderer=self.renderer)
+        self._export_records(({"module": module, **stats} for module, stats in sorted(module_churn.items())), "churn")
+        return module_churn
+
+    def impact(self, changed_paths) -> set[str]:
+        """Modules affected by a change to `changed_paths` (relative to the code root or absolute): the changed modules and all their dependents."""
+        changed = set()
+        for path in changed_paths:
+            module = self.index.module_name(os.path.join(self.code_root_folder, path))
+            if module is None:
+                logger.debug(f"Ignoring changed path '{path}' (not a module file).")
+            else:
+                changed.add(module)
+        impacted = self.reachability.impacted(changed)
+        logger.info(f"{len(changed)} changed modules impact {len(impacted)} modules.")
+        self._export_records(({"module": module, "changed": module in changed} for module in sorted(impacted)), "impact")
+        return impacted
+
+    def co_change(self, since_date, top_k: int | None = None, max_commit_modules: int = MAX_COMMIT_MODULES, min_count: int = 2) -> list[dict]:
+        """Pairs of modules changed together at least `min_count` times, joined with the import graph."""
+        co_change = analyze_co_change(self.code_root_folder, since_date, index=self.index, max_commit_modules=max_commit_modules, top_k=top_k)
+        records = list(coupling_records(co_change, self.compact_graph, min_count))
+        hidden = [record for record in records if record["hidden"]]
+        logger.info(f"{len(hidden)} of {len(records)} co-changing module pairs have no import between them.")
+        for record in hidden[:10]:
+            logger.info(f"  {record['module_a']} <-> {record['module_b']}: {record['count']} commits (jaccard {record['jaccard']})")
+        self._export_records(records, "co_change")
+        return records
+
+    def churn_series(self, since_date, bucket_days: int = 7, window: int = 4, top_n: int = 5) -> ChurnSeries:
+        """Per-module churn in buckets of `bucket_days` since `since_date`, saved as .npy for dashboards.
+
+        The series goes to `export_dir` (or the default folder) together with
+        the top modules of every rolling `window` of buckets.
+        """
+        series = build_churn_series(self.code_root_folder, since_date, bucket_days=bucket_days, index=self.index)
+        series.save(self.export_dir or DEFAULT_CHURN_SERIES_DIR)
+        self._export_records(
+            ({"bucket_start": start, "window_buckets": window, "top": [{"module": module, "churn": value} for module, value in leaders]} for start, leaders in series.top(top_n, window)),
+            "churn_series_top",
+        )
+        if self.renderer is not None:
+            self.renderer.submit("churn_series", series)
+        return series
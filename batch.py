@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from centrality import CentralityEngine
+from churn_metrics import add_commit_churn, aiter_commits, module_resolver, new_module_churn
+from exports import EXPORT_FORMATS, export_graph, write_jsonl
+from file_utils import EXCLUDED_DIRS, project_index
+from graph_builder import chunk_size_for, graph_from_imports, parse_chunk_unresolved
+from import_cache import DEFAULT_CACHE_PATH, ImportCache
+from import_parser import SCANNERS, resolve_imports
+from module_trie import MATCH_POLICIES, ModuleTrie
+
+logger = logging.getLogger(__name__)
+
+BATCH_CENTRALITY_MODES = ("exact", "sampled")
+
+
+def read_manifest(path: str) -> list[str]:
+    """Repository roots listed in a manifest, one per line; blank lines and `#` comments are skipped.
+
+    Relative roots are taken relative to the manifest's folder.
+    """
+    base = Path(path).parent
+    roots = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                roots.append(str(base / line) if not os.path.isabs(line) else line)
+    return roots
+
+def _output_names(roots) -> dict:
+    """A distinct output folder name per root, from its basename."""
+    names, used = {}, set()
+    for root in roots:
+        base = Path(root).resolve().name or "root"
+        name, i = base, 1
+        while name in used:
+            i += 1
+            name = f"{base}-{i}"
+        used.add(name)
+        names[root] = name
+    return names
+
+def _betweenness(G, mode, k, seed):
+    """Betweenness centrality of one repository's graph, run on the shared pool."""
+    return CentralityEngine(mode, k=k, seed=seed).betweenness(G)
+
+
+class BatchRunner:
+    """Analyze several repositories at once, sharing one worker pool and one import cache.
+
+    Every repository is a coroutine: its tree is indexed in a thread, its
+    `git log` is read through an asyncio subprocess while its files are parsed
+    in chunks on the shared process pool, then its betweenness runs on the
+    same pool. Chunks of all repositories interleave on the pool, so a small
+    repository finishes early instead of waiting behind a large one. Results
+    are exported under `output_dir/<repo>/` and a status line is appended to
+    `output_dir/batch.jsonl` as each repository finishes; a failing repository
+    is recorded there and does not stop the others.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        cache_path: str | None = None,
+        jobs: int | None = None,
+        match_policy: str = "package",
+        scanner: str = "ast",
+        since_date: str = "6 months ago",
+        centrality_mode: str = "exact",
+        centrality_k: int = 256,
+        centrality_seed: int | None = 0,
+        max_concurrent: int = 4,
+        export_formats=EXPORT_FORMATS,
+    ):
+        if centrality_mode not in BATCH_CENTRALITY_MODES:
+            raise ValueError(f"Unknown batch centrality mode '{centrality_mode}', expected one of {BATCH_CENTRALITY_MODES}.")
+        self.output_dir = output_dir
+        self.cache_path = cache_path
+        self.jobs = jobs or os.cpu_count() or 1
+        self.match_policy = match_policy
+        self.scanner = scanner
+        self.since_date = since_date
+        self.centrality_mode = centrality_mode
+        self.centrality_k = centrality_k
+        self.centrality_seed = centrality_seed
+        self.max_concurrent = max_concurrent
+        self.export_formats = export_formats
+
+    def run(self, roots) -> list[dict]:
+        """Analyze every root and return their status records, in input order."""
+        return asyncio.run(self._run(list(roots)))
+
+    async def _run(self, roots):
+        os.makedirs(self.output_dir, exist_ok=True)
+        names = _output_names(roots)
+        limit = asyncio.Semaphore(max(1, self.max_concurrent))
+        cache = ImportCache(self.cache_path) if self.cache_path else None
+        status_path = os.path.join(self.output_dir, "batch.jsonl")
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool, open(status_path, 'w', encoding='utf-8') as status_file:
+                async def one(root):
+                    async with limit:
+                        record = await self._analyze(root, names[root], pool, cache)
+                    status_file.write(json.dumps(record) + '\n')
+                    status_file.flush()
+                    return record
+                records = await asyncio.gather(*(one(root) for root in roots))
+        finally:
+            if cache is not None:
+                cache.report()
+                cache.close()
+        failed = sum(record["status"] != "ok" for record in records)
+        logger.info(f"Batch of {len(records)} repositories done ({failed} failed); statuses in {status_path}.")
+        return records
+
+    async def _analyze(self, root, name, pool, cache) -> dict:
+        start = time.perf_counter()
+        record = {"root": str(root), "output": os.path.join(self.output_dir, name)}
+        try:
+            if not os.path.isdir(root):
+                raise FileNotFoundError(f"'{root}' is not a directory.")
+            index = await asyncio.to_thread(project_index, root, EXCLUDED_DIRS)
+            churn = asyncio.create_task(self._churn(root, index))
+            try:
+                G = await self._graph(index, pool, cache)
+                betweenness = await asyncio.get_running_loop().run_in_executor(pool, _betweenness, G, self.centrality_mode, self.centrality_k, self.centrality_seed)
+            except BaseException:
+                churn.cancel()
+                raise
+            try:
+                module_churn = await churn
+            except Exception as e:
+                module_churn = {}
+                record["churn_error"] = str(e)
+                logger.warning(f"Churn of '{root}' failed: {e}")
+
+            out = record["output"]
+            export_graph(G, out, "dependency_graph", self.export_formats)
+            write_jsonl(
+                ({"module": node, "in_degree": G.in_degree(node), "out_degree": G.out_degree(node), "betweenness": betweenness.get(node, 0.0)} for node in sorted(G)),
+                os.path.join(out, "centrality.jsonl"),
+            )
+            write_jsonl(({"module": module, **stats} for module, stats in sorted(module_churn.items())), os.path.join(out, "churn.jsonl"))
+            record.update(status="ok", nodes=len(G), edges=G.number_of_edges(), churned_modules=len(module_churn))
+        except Exception as e:
+            logger.error(f"Analysis of '{root}' failed: {e}")
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        logger.info(f"Finished '{root}' ({record['status']}) in {record['seconds']}s.")
+        return record
+
+    async def _graph(self, index, pool, cache):
+        """File-level import graph of one repository, parsing its cache misses on the shared pool."""
+        modules = list(index.modules())
+        all_targets = [None] * len(modules)
+        pending = []
+        for i, (file_path, source_module) in enumerate(modules):
+            imports = cache.lookup(file_path, source_module, self.scanner) if cache is not None else None
+            if imports is None:
+                pending.append(i)
+            else:
+                all_targets[i] = resolve_imports(imports, index)
+
+        loop = asyncio.get_running_loop()
+        chunk_size = chunk_size_for(len(pending), self.jobs)
+        batches = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+        futures = [loop.run_in_executor(pool, parse_chunk_unresolved, ([modules[i] for i in batch], self.scanner)) for batch in batches]
+        for batch, future in zip(batches, futures):
+            for i, (imports, size, mtime_ns, digest) in zip(batch, await future):
+                if cache is not None:
+                    file_path, source_module = modules[i]
+                    cache.store(file_path, source_module, imports, size, mtime_ns, digest, self.scanner)
+                all_targets[i] = resolve_imports(imports, index)
+        logger.info(f"Parsed {len(pending)} of {len(modules)} files of '{index.root}' ({len(modules) - len(pending)} cached).")
+
+        valid_modules = ModuleTrie(index.path_to_module.values())
+        return graph_from_imports(modules, all_targets, valid_modules, self.match_policy)
+
+    async def _churn(self, root, index) -> dict:
+        """Module churn of one repository since `since_date`, read from `git log` without blocking the loop."""
+        if not (Path(root) / ".git").exists():
+            raise RuntimeError(f"'{root}' is not a git repository.")
+        module_for = module_resolver(Path(root), index)
+        module_churn = new_module_churn()
+        # aclosing stops `git log` as soon as the task is cancelled, e.g. when the graph build failed.
+        async with contextlib.aclosing(aiter_commits(root, f'--since={self.since_date}')) as commits:
+            async for _, _, files in commits:
+                add_commit_churn(module_churn, files, module_for)
+        return dict(module_churn)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dependency and churn analysis of several Python repositories on one shared worker pool.")
+    parser.add_argument("roots", nargs="*", help="Repository roots to analyze.")
+    parser.add_argument("--manifest", default=None, help="File listing repository roots, one per line ('#' starts a comment).")
+    parser.add_argument("--output", default="./batch", help="Folder receiving one subfolder of results per repository and batch.jsonl.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite file caching parsed imports, shared by all repositories.")
+    parser.add_argument("--no-cache", action="store_true", help="Parse every file without using the import cache.")
+    parser.add_argument("--jobs", type=int, default=0, help="Worker processes shared by all repositories (0 = all cores).")
+    parser.add_argument("--max-concurrent", type=int, default=4, help="Repositories analyzed at the same time.")
+    parser.add_argument("--since", default="6 months ago", help="Churn window, as a `git log --since` expression.")
+    parser.add_argument("--match-policy", choices=MATCH_POLICIES, default="package", help="How import targets are matched against the project's modules.")
+    parser.add_argument("--scanner", choices=SCANNERS, default="ast", help="Import extraction: full AST, lexical scan of import statements, or lexical without function bodies.")
+    parser.add_argument("--centrality", choices=BATCH_CENTRALITY_MODES, default="exact", help="Betweenness algorithm: exact, or sampled pivots.")
+    parser.add_argument("--centrality-k", type=int, default=256, help="Number of pivot sources in sampled mode.")
+    parser.add_argument("--centrality-seed", type=int, default=0, help="Random seed for choosing the sampled pivots.")
+    parser.add_argument("--export-format", nargs="+", choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS), help="Graph file formats written per repository.")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    roots = list(args.roots)
+    if args.manifest:
+        roots += read_manifest(args.manifest)
+    if not roots:
+        logger.error("No repository roots given (pass them as arguments or with --manifest).")
+        return 2
+
+    runner = BatchRunner(
+        args.output,
+        cache_path=None if args.no_cache else args.cache,
+        jobs=args.jobs,
+        match_policy=args.match_policy,
+        scanner=args.scanner,
+        since_date=args.since,
+        centrality_mode=args.centrality,
+        centrality_k=args.centrality_k,
+        centrality_seed=args.centrality_seed,
+        max_concurrent=args.max_concurrent,
+        export_formats=args.export_format,
+    )
+    records = runner.run(roots)
+    return 1 if any(record["status"] != "ok" for record in records) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import argparse
+import ast
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from centrality import CentralityEngine
+from churn_metrics import analyze_churn
+from churn_store import ChurnStore
+from file_utils import EXCLUDED_DIRS, ProjectIndex, clear_project_indexes
+from graph_builder import build_dependency_graph
+from hierarchy_rollup import HierarchyRollup
+from import_parser import extract_imports, parse_file, resolve_imports
+from module_trie import ModuleTrie
+
+# A stage counts as regressed when it is slower than its baseline by more than this fraction.
+DEFAULT_REGRESSION_THRESHOLD = 0.25
+
+# Stages faster than this (in seconds) are too noisy to flag as regressions.
+MIN_COMPARABLE_SECONDS = 0.005
+
+SYNTHETIC_PACKAGE = "synth"
+
+# Churn window used by the benchmark: early enough to cover the whole synthetic history.
+CHURN_SINCE = "2000-01-01"
+
+
+def generate_synthetic_repo(
+    root: str,
+    files: int = 500,
+    depth: int = 3,
+    fanout: int = 5,
+    relative_ratio: float = 0.3,
+    syntax_error_ratio: float = 0.02,
+    commits: int = 200,
+    seed: int = 0,
+) -> Path:
+    """Write a synthetic package tree under `root` and give it a synthetic git history.
+
+    Modules are spread over packages nested up to `depth` levels below the
+    top-level `synth` package. Every module imports `fanout` other modules,
+    a `relative_ratio` share of them with relative imports, and a
+    `syntax_error_ratio` share of the modules do not parse. The history has
+    `commits` commits, each rewriting a few modules, and is written with
+    `git fast-import` so even long histories take seconds to create.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    packages = [(SYNTHETIC_PACKAGE,)]
+    while len(packages) < max(1, files // 10):
+        parent = rng.choice(packages)
+        if len(parent) <= depth:
+            packages.append(parent + (f"pkg{len(packages)}",))
+    modules = [rng.choice(packages) + (f"mod{i}",) for i in range(files)]
+
+    def module_source(module, revision):
+        lines = []
+        for target in rng.sample(modules, min(fanout, len(modules) - 1)):
+            if target == module:
+                continue
+            common = 0
+            while common < min(len(module), len(target)) - 1 and module[common] == target[common]:
+                common += 1
+            if rng.random() < relative_ratio and common > 0:
+                level = len(module) - 1 - common + 1
+                rest = ".".join(target[common:-1])
+                lines.append(f"from {'.' * level}{rest} import {target[-1]}")
+            else:
+                lines.append(f"import {'.'.join(target)}")
+        lines.append("")
+        lines.append(f"def f{revision}(x):")
+        lines.append("    return x + 1")
+        if rng.random() < syntax_error_ratio:
+            lines.append("def broken(:")
+        lines.extend(f"# revision {revision} line {i}" for i in range(rng.randint(1, 20)))
+        return "\n".join(lines) + "\n"
+
+    def path_of(parts, init=False):
+        return "/".join(parts) + ("/__init__.py" if init else ".py")
+
+    initial = {path_of(package, init=True): "" for package in packages}
+    initial.update({path_of(module): module_source(module, 0) for module in modules})
+
+    root.mkdir(parents=True, exist_ok=True)
+    subprocess.run(['git', 'init', '-q'], cwd=root, check=True)
+    subprocess.run(['git', 'symbolic-ref', 'HEAD', 'refs/heads/master'], cwd=root, check=True)
+    stream = []
+    timestamp = 1_600_000_000
+    for revision in range(max(commits, 1)):
+        if revision == 0:
+            changed = initial
+        else:
+            changed = {path_of(module): module_source(module, revision) for module in rng.sample(modules, min(len(modules), rng.randint(1, 5)))}
+        timestamp += rng.randint(600, 86400)
+        message = f"revision {revision}"
+        stream.append(f"commit refs/heads/master\ncommitter Bench <bench@example.com> {timestamp} +0000\ndata {len(message)}\n{message}\n")
+        for path, content in changed.items():
+            data = content.encode('utf-8')
+            stream.append(f"M 644 inline {path}\ndata {len(data)}\n{content}\n")
+        stream.append("\n")
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=root, input="".join(stream).encode('utf-8'), check=True)
+    subprocess.run(['git', 'reset', '-q', '--hard', 'master'], cwd=root, check=True)
+    return root
+
+def _best_of(repeat, fn, setup=None):
+    """Best wall time of `repeat` calls of `fn`, and the result of the last call; `setup` runs untimed before each call."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def benchmark_pipeline(code_root_folder: str, repeat: int = 3, render: bool = False, centrality_k: int = 256) -> tuple[dict, dict]:
+    """Time every stage of the analysis on one tree; return `{stage: seconds}` (best of `repeat`) and the workload sizes.
+
+    Stages run in pipeline order on the previous stage's output, so each
+    timing isolates one step: discovery, parsing, resolution, edge filtering,
+    the full uncached graph build, centrality, rollup, churn and optionally
+    rendering (layout and a figure written with the Agg backend).
+    """
+    stages = {}
+    stages["discovery"], index = _best_of(repeat, lambda: ProjectIndex(code_root_folder, EXCLUDED_DIRS))
+    modules = list(index.modules())
+    stages["module_resolution"], _ = _best_of(repeat, lambda: [index.module_name(path) for path, _ in modules])
+
+    for scanner in ("ast", "lexical"):
+        stages[f"parsing_{scanner}"], parsed = _best_of(repeat, lambda: [parse_file(path, module, scanner=scanner)[0] for path, module in modules])
+    stages["import_resolution"], resolved = _best_of(repeat, lambda: [resolve_imports(imports, index) for imports in parsed])
+
+    def filter_edges():
+        valid_modules = ModuleTrie(module for _, module in modules)
+        return [(source, target) for (_, source), targets in zip(modules, resolved) for target in targets if valid_modules.matches(target, "package")]
+    stages["edge_filtering"], _ = _best_of(repeat, filter_edges)
+    # Every repeat must discover the tree again instead of reusing the shared ProjectIndex.
+    stages["graph_build"], G = _best_of(repeat, lambda: build_dependency_graph(code_root_folder), setup=clear_project_indexes)
+
+    stages["centrality_exact"], _ = _best_of(repeat, lambda: CentralityEngine("exact").betweenness(G))
+    stages["centrality_sampled"], _ = _best_of(repeat, lambda: CentralityEngine("sampled", k=centrality_k).betweenness(G))
+    stages["rollup"], _ = _best_of(repeat, lambda: HierarchyRollup(G).graphs())
+
+    stages["churn"], _ = _best_of(repeat, lambda: analyze_churn(code_root_folder, CHURN_SINCE, index=index))
+    with tempfile.TemporaryDirectory() as store_dir:
+        with ChurnStore(os.path.join(store_dir, "churn.sqlite")) as store:
+            stages["churn_store_initial"], _ = _best_of(1, lambda: analyze_churn(code_root_folder, CHURN_SINCE, index=index, store=store))
+            stages["churn_store_warm"], _ = _best_of(repeat, lambda: analyze_churn(code_root_folder, CHURN_SINCE, index=index, store=store))
+
+    if render:
+        import matplotlib
+        matplotlib.use("Agg")
+        from graph_builder import draw_graph
+        from graph_layout import compute_layout
+        stages["layout"], _ = _best_of(repeat, lambda: compute_layout(G))
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as render_dir:
+            os.chdir(render_dir)
+            try:
+                os.mkdir("img")
+                stages["rendering"], _ = _best_of(1, lambda: draw_graph(G))
+            finally:
+                os.chdir(cwd)
+    sizes = {"modules": len(modules), "nodes": len(G), "edges": G.number_of_edges()}
+    return stages, sizes
+
+def compare_to_baseline(stages: dict, baseline: dict, threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> list[tuple[str, float, float]]:
+    """Stages slower than in `baseline` by more than `threshold`, as `(stage, baseline_seconds, seconds)`."""
+    regressions = []
+    for stage, seconds in stages.items():
+        before = baseline.get(stage)
+        if before is None or max(before, seconds) < MIN_COMPARABLE_SECONDS:
+            continue
+        if seconds > before * (1 + threshold):
+            regressions.append((stage, before, seconds))
+    return regressions
+
+
+def benchmark_import_scanner(code_root_folder: str, repeat: int = 3) -> dict:
+    """Time the AST and lexical import extractors over every module file of a tree.
+
+    Sources are read into memory first so only extraction is timed. The import
+    sets of both extractors are compared for every file that `ast.parse`
+    accepts; files with syntax errors take the AST path's regex fallback and
+    are only counted.
+    """
+    index = ProjectIndex(code_root_folder, EXCLUDED_DIRS)
+    sources = []
+    for file_path, source_module in index.modules():
+        with open(file_path, 'rb') as f:
+            sources.append((file_path, source_module, f.read()))
+
+    timings = {}
+    results = {}
+    for scanner in ("ast", "lexical"):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = [extract_imports(source, module, filename=path, scanner=scanner) for path, module, source in sources]
+            best = min(best, time.perf_counter() - start)
+        timings[scanner] = best
+        results[scanner] = found
+
+    mismatches = []
+    unparseable = 0
+    for (path, _, source), from_ast, from_scan in zip(sources, results["ast"], results["lexical"]):
+        try:
+            ast.parse(source)
+        except (SyntaxError, ValueError):
+            unparseable += 1
+            continue
+        if from_ast != from_scan:
+            mismatches.append(path)
+
+    return {
+        "files": len(sources),
+        "bytes": sum(len(source) for _, _, source in sources),
+        "ast_seconds": timings["ast"],
+        "lexical_seconds": timings["lexical"],
+        "speedup": timings["ast"] / timings["lexical"] if timings["lexical"] else float("inf"),
+        "unparseable_files": unparseable,
+        "mismatched_files": mismatches,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the dependency analysis pipeline.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    scanner = subparsers.add_parser("scanner", help="Compare the AST and lexical import extractors.")
+    scanner.add_argument("code_root", nargs="?", default="./content/numpy/")
+    scanner.add_argument("--repeat", type=int, default=3)
+    pipeline = subparsers.add_parser("pipeline", help="Time every pipeline stage on a synthetic (or given) repository.")
+    pipeline.add_argument("--code-root", default=None, help="Benchmark this tree instead of generating a synthetic one.")
+    pipeline.add_argument("--files", type=int, default=500)
+    pipeline.add_argument("--depth", type=int, default=3, help="Maximum package nesting below the top-level package.")
+    pipeline.add_argument("--fanout", type=int, default=5, help="Imports per module.")
+    pipeline.add_argument("--relative-ratio", type=float, default=0.3, help="Share of imports written as relative imports.")
+    pipeline.add_argument("--syntax-error-ratio", type=float, default=0.02, help="Share of modules that do not parse.")
+    pipeline.add_argument("--commits", type=int, default=200, help="Length of the synthetic git history.")
+    pipeline.add_argument("--seed", type=int, default=0)
+    pipeline.add_argument("--repeat", type=int, default=3)
+    pipeline.add_argument("--render", action="store_true", help="Also time the layout and a rendered figure.")
+    pipeline.add_argument("--output", default=None, help="Write the results as JSON to this file.")
+    pipeline.add_argument("--baseline", default=None, help="JSON results of an earlier run to compare against.")
+    pipeline.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="Allowed slowdown per stage before it counts as a regression.")
+    args = parser.parse_args(argv)
+
+    if args.benchmark == "scanner":
+        result = benchmark_import_scanner(args.code_root, repeat=args.repeat)
+        print(f"{result['files']} files, {result['bytes'] / 1e6:.1f} MB")
+        print(f"ast:     {result['ast_seconds']:.3f}s")
+        print(f"lexical: {result['lexical_seconds']:.3f}s ({result['speedup']:.1f}x faster)")
+        print(f"identical import sets on all parseable files: {not result['mismatched_files']}")
+        for path in result["mismatched_files"]:
+            print(f"  mismatch: {path}")
+        if result["unparseable_files"]:
+            print(f"{result['unparseable_files']} files do not parse and were not compared")
+        return 0
+
+    parameters = {key: getattr(args, key) for key in ("files", "depth", "fanout", "relative_ratio", "syntax_error_ratio", "commits", "seed", "repeat", "render")}
+    with tempfile.TemporaryDirectory() as workspace:
+        if args.code_root:
+            code_root = args.code_root
+            parameters = {"code_root": code_root, "repeat": args.repeat, "render": args.render}
+        else:
+            start = time.perf_counter()
+            code_root = str(generate_synthetic_repo(
+                workspace,
+                files=args.files,
+                depth=args.depth,
+                fanout=args.fanout,
+                relative_ratio=args.relative_ratio,
+                syntax_error_ratio=args.syntax_error_ratio,
+                commits=args.commits,
+                seed=args.seed,
+            ))
+            print(f"Generated a synthetic repository in {time.perf_counter() - start:.2f}s.")
+        stages, sizes = benchmark_pipeline(code_root, repeat=args.repeat, render=args.render)
+
+    results = {
+        "parameters": parameters,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sizes": sizes,
+        "stages": stages,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != parameters:
+            print("Warning: the baseline was recorded with different parameters.")
+
+    print(f"{sizes['modules']} modules, graph of {sizes['nodes']} nodes and {sizes['edges']} edges")
+    for stage, seconds in stages.items():
+        line = f"{stage:<22}{seconds * 1000:>10.1f} ms"
+        if baseline and stage in baseline["stages"]:
+            line += f"   (baseline {baseline['stages'][stage] * 1000:.1f} ms)"
+        print(line)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        regressions = compare_to_baseline(stages, baseline["stages"], args.threshold)
+        for stage, before, after in regressions:
+            print(f"REGRESSION {stage}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms (+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,79 +1,244 @@
+import asyncio
 import subprocess
 import re
+import tempfile
 from collections import defaultdict
-import matplotlib.pyplot as plt
-from file_utils import module_name_from_file_path
+import instrumentation
+from file_utils import EXCLUDED_DIRS, project_index
+from rendering import save_figure
 from pathlib import Path
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def analyze_churn(code_root_folder, since_date):
-    
-    code_root_folder = Path(code_root_folder)
-    if not (code_root_folder / ".git").exists():
-        logger.error(f"'{code_root_folder}' is not a git repository.")
-        return {}
+COMMIT_PREFIX = "commit "
+NUMSTAT_LINE = re.compile(r'^(\d+|-)\t(\d+|-)\t(.+)$')
+BRACED_RENAME = re.compile(r'^(.*)\{(.*) => (.*)\}(.*)$')
+
+
+def rename_target(path: str) -> str:
+    """Return the new path of a numstat entry, resolving `old => new` and `dir/{old => new}/f.py`."""
+    match = BRACED_RENAME.match(path)
+    if match:
+        prefix, _, new, suffix = match.groups()
+        return (prefix + new + suffix).replace('//', '/')
+    if ' => ' in path:
+        return path.split(' => ', 1)[1]
+    return path
 
-    cmd = [
+def _git_log_command(*log_args) -> list[str]:
+    return [
         'git',
+        '-c', 'core.quotepath=off',
         'log',
-        f'--since={since_date}',
+        *log_args,
         '--numstat',
-        '--pretty=format:',
+        f'--pretty=format:{COMMIT_PREFIX}%H %ct',
     ]
-    try:
+
+
+class _NumstatParser:
+    """Incremental parser of `git log --numstat` lines; `feed` returns each commit once its last line is seen."""
+
+    def __init__(self):
+        self.sha, self.timestamp, self.files = None, 0, []
+        self.lines_read = 0
+
+    def feed(self, line: str):
+        self.lines_read += 1
+        line = line.rstrip('\n')
+        if line.startswith(COMMIT_PREFIX):
+            done = self.finish()
+            sha, _, ts = line[len(COMMIT_PREFIX):].partition(' ')
+            self.sha, self.timestamp, self.files = sha, int(ts or 0), []
+            return done
+        match = NUMSTAT_LINE.match(line)
+        if match:
+            added, deleted, file_path = match.groups()
+            self.files.append((
+                0 if added == '-' else int(added),
+                0 if deleted == '-' else int(deleted),
+                rename_target(file_path),
+            ))
+        elif line:
+            logger.debug(f"Skipping malformed line: {line}")
+        return None
+
+    def finish(self):
+        """The commit being parsed, if any, as `(sha, timestamp, files)`."""
+        if self.sha is None:
+            return None
+        commit = (self.sha, self.timestamp, self.files)
+        self.sha, self.timestamp, self.files = None, 0, []
+        return commit
+
+
+def iter_commits(code_root_folder, *log_args):
+    """Stream `git log --numstat` output, yielding `(sha, timestamp, [(added, deleted, path), ...])` per commit.
+
+    Lines are parsed as they arrive so memory stays bounded by one commit.
+    Binary files report `-` and count as 0 lines; renamed files are reported
+    under their new path.
+    """
+    with tempfile.TemporaryFile() as stderr:
         process = subprocess.Popen(
-            cmd,
+            _git_log_command(*log_args),
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=stderr,
             cwd=code_root_folder,
             text=True,
+            encoding='utf-8',
+            errors='replace',
         )
-        stdout, stderr = process.communicate()
-        if process.returncode != 0:
-            logger.error(f"Error running git command: {stderr}")
-            return {}
-    except Exception as e:
-        logger.error(f"Failed to execute git command: {e}")
-        return {}
+        parser = _NumstatParser()
+        completed = False
+        try:
+            with process.stdout:
+                for line in process.stdout:
+                    commit = parser.feed(line)
+                    if commit is not None:
+                        yield commit
+            completed = True
+            commit = parser.finish()
+            if commit is not None:
+                yield commit
+        finally:
+            # The consumer may stop early (or fail); don't leave git running.
+            # After EOF git is exiting on its own and must not be killed.
+            if not completed and process.poll() is None:
+                process.kill()
+                process.wait()
+        instrumentation.count("git_lines_read", parser.lines_read)
 
-    lines = stdout.strip().split('\n')
-    logger.debug(f"Raw git log output lines: {len(lines)}")
-    py_lines = [line for line in lines if line.strip() and line.split()[-1].endswith('.py')]
-    logger.debug(f"Filtered .py lines: {len(py_lines)}")
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"Error running git command: {stderr.read().decode(errors='replace').strip()}")
 
-    if not py_lines:
-        logger.warning(f"No .py files found in git log since {since_date}.")
-        return {}
+async def aiter_commits(code_root_folder, *log_args):
+    """Asynchronous `iter_commits`: `git log` runs as an asyncio subprocess, so several can overlap with other work."""
+    process = await asyncio.create_subprocess_exec(
+        *_git_log_command(*log_args),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(code_root_folder),
+        limit=2 ** 20,
+    )
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+    parser = _NumstatParser()
+    completed = False
+    try:
+        async for line in process.stdout:
+            commit = parser.feed(line.decode('utf-8', errors='replace'))
+            if commit is not None:
+                yield commit
+        completed = True
+        commit = parser.finish()
+        if commit is not None:
+            yield commit
+    finally:
+        # Cancelled (e.g. a failed batch job) or closed early: stop git rather than leave it to the garbage collector.
+        # After EOF git is exiting on its own and must not be killed.
+        if not completed and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            stderr_task.cancel()
+    instrumentation.count("git_lines_read", parser.lines_read)
 
-    churn_data = defaultdict(lambda: {'added': 0, 'deleted': 0, 'commits': 0})
-    current_file = None
+    stderr = await stderr_task
+    if await process.wait() != 0:
+        raise RuntimeError(f"Error running git command: {stderr.decode(errors='replace').strip()}")
 
-    for line in py_lines:
-        match = re.match(r'(\d+)\s+(\d+)\s+(.+)', line.strip())
-        if match:
-            added, deleted, file_path = match.groups()
-            current_file = file_path
-            churn_data[current_file]['added'] += int(added)
-            churn_data[current_file]['deleted'] += int(deleted)
-            churn_data[current_file]['commits'] += 1
-        else:
-            logger.debug(f"Skipping malformed line: {line}")
-            current_file = None
+def since_timestamp(code_root_folder, since_date) -> int:
+    """Translate a `git log --since` expression into a Unix timestamp, exactly as git would."""
+    result = subprocess.run(['git', 'rev-parse', f'--since={since_date}'], cwd=code_root_folder, capture_output=True, text=True)
+    value = result.stdout.strip()
+    if result.returncode != 0 or not value.startswith('--max-age='):
+        raise ValueError(f"Cannot interpret since date '{since_date}': {result.stderr.strip()}")
+    return int(value[len('--max-age='):])
+
+def module_resolver(code_root_folder: Path, index):
+    """Memoized mapping from a repo-relative file path to its module name (None outside the index)."""
+    file_modules = {}
+    def module_for(file_path):
+        if file_path not in file_modules:
+            file_modules[file_path] = index.module_name(str(code_root_folder / file_path))
+            if file_modules[file_path] is None:
+                logger.debug(f"Skipped file '{file_path}' in module_churn (no valid module name).")
+        return file_modules[file_path]
+    return module_for
+
+def new_module_churn():
+    return defaultdict(lambda: {'added': 0, 'deleted': 0, 'commits': 0})
 
-    excluded_dirs = {"_pyinstaller", "tools", "doc", "benchmarks", "ci", "wheels", "swig"}
+def add_commit_churn(module_churn, files, module_for) -> bool:
+    """Add one commit's numstat entries to `module_churn`, counting the commit once per module; return whether it touched a .py file."""
+    touched = set()
+    py_files_seen = False
+    for added, deleted, file_path in files:
+        if not file_path.endswith('.py'):
+            continue
+        py_files_seen = True
+        module = module_for(file_path)
+        if module is None:
+            continue
+        module_churn[module]['added'] += added
+        module_churn[module]['deleted'] += deleted
+        touched.add(module)
+    for module in touched:
+        module_churn[module]['commits'] += 1
+    return py_files_seen
 
-    module_churn = defaultdict(lambda: {'added': 0, 'deleted': 0, 'commits': 0})
-    for file_path, stats in churn_data.items():
-        module = module_name_from_file_path(file_path, code_root_folder, strict=False, excluded_dirs=excluded_dirs)
+def add_window_churn(module_churn, rows, module_for) -> bool:
+    """Add the `(path, added, deleted, commits)` rows of `ChurnStore.window` to `module_churn`; return whether any was a .py file."""
+    py_files_seen = False
+    for file_path, added, deleted, commits in rows:
+        if not file_path.endswith('.py'):
+            continue
+        py_files_seen = True
+        module = module_for(file_path)
         if module is not None:
-            module_churn[module]['added'] += stats['added']
-            module_churn[module]['deleted'] += stats['deleted']
-            module_churn[module]['commits'] += stats['commits']
+            module_churn[module]['added'] += added
+            module_churn[module]['deleted'] += deleted
+            module_churn[module]['commits'] += commits
+    return py_files_seen
+
+@instrumentation.timed("churn")
+def analyze_churn(code_root_folder, since_date, index=None, store=None, draw=False, renderer=None):
+    """Aggregate per-module churn since `since_date`.
+
+    With a ChurnStore, only commits newer than the store's last update are
+    read from git and the window is answered from its daily buckets; module
+    commit counts are then summed per file rather than deduplicated per commit.
+    The top modules are plotted only when `draw` is set, or queued on `renderer`.
+    """
+    code_root_folder = Path(code_root_folder)
+    if not (code_root_folder / ".git").exists():
+        logger.error(f"'{code_root_folder}' is not a git repository.")
+        return {}
+
+    if index is None:
+        index = project_index(code_root_folder, EXCLUDED_DIRS)
+
+    module_for = module_resolver(code_root_folder, index)
+    module_churn = new_module_churn()
+    py_files_seen = False
+    try:
+        if store is not None:
+            store.update(code_root_folder)
+            py_files_seen = add_window_churn(module_churn, store.window(since_timestamp(code_root_folder, since_date)), module_for)
         else:
-            logger.debug(f"Skipped file '{file_path}' in module_churn (no valid module name).")
+            for _, _, files in iter_commits(code_root_folder, f'--since={since_date}'):
+                py_files_seen |= add_commit_churn(module_churn, files, module_for)
+    except Exception as e:
+        logger.error(f"Failed to execute git command: {e}")
+        return {}
+
+    if not py_files_seen:
+        logger.warning(f"No .py files found in git log since {since_date}.")
+        return {}
 
     for module, stats in module_churn.items():
         total_churn = stats['added'] + stats['deleted']
@@ -91,7 +256,17 @@ def analyze_churn(code_root_folder, since_date):
     for module, stats in top_churn:
         logger.info(f"{module}: {stats['added'] + stats['deleted']} lines")
 
-    Path("./img").mkdir(exist_ok=True)
+    if renderer is not None:
+        renderer.submit("churn_analysis", top_churn, since_date)
+    elif draw:
+        draw_churn(top_churn, since_date)
+
+    return module_churn
+
+@instrumentation.timed("rendering")
+def draw_churn(top_churn, since_date, output_file="./img/churn_analysis.png", dpi=300, formats=None):
+    """Bar plot of the total churn of `(module, stats)` pairs."""
+    import matplotlib.pyplot as plt
 
     if top_churn:
         modules, churns = zip(*[(m, s['added'] + s['deleted']) for m, s in top_churn])
@@ -102,9 +277,6 @@ def analyze_churn(code_root_folder, since_date):
         plt.ylabel('Total Churn (Lines Added + Deleted)')
         plt.title(f"Top 5 Modules by Churn (Since {since_date})")
         plt.tight_layout()
-        plt.savefig("./img/churn_analysis.png", dpi=300, bbox_inches='tight')
-        plt.close()
-    else:
-        logger.warning("No modules with churn data to plot.")
-
-    return module_churn
\ No newline at end of file
+        return save_figure(output_file, dpi, formats, bbox_inches='tight')
+    logger.warning("No modules with churn data to plot.")
+    return []
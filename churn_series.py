@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+import instrumentation
+from churn_metrics import iter_commits, module_resolver, since_timestamp
+from file_utils import EXCLUDED_DIRS, project_index
+from rendering import save_figure
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("added", "deleted", "commits")
+
+SECONDS_PER_DAY = 86400
+
+DEFAULT_CHURN_SERIES_DIR = "./img/churn_series"
+
+
+class ChurnSeries:
+    """Churn of every module binned into fixed-width time buckets.
+
+    `data[m, i, b]` holds metric `METRICS[m]` of module `modules[i]` in the
+    bucket starting at `bucket_starts[b]`; commits count once per module. The
+    array is dense (modules x buckets), so windows, rankings and trends are
+    plain NumPy reductions, and `save` / `load` keep it as a `.npy` file that
+    dashboards can memory-map.
+    """
+
+    def __init__(self, modules, bucket_starts, bucket_seconds: int, data):
+        self.modules = list(modules)
+        self.bucket_starts = np.asarray(bucket_starts, dtype=np.int64)
+        self.bucket_seconds = bucket_seconds
+        self.data = data
+
+    def metric(self, name: str = "churn") -> np.ndarray:
+        """Modules x buckets array of one of `METRICS`, or of "churn" (added + deleted lines)."""
+        if name == "churn":
+            return self.data[0].astype(np.int64) + self.data[1]
+        if name not in METRICS:
+            raise ValueError(f"Unknown churn metric '{name}', expected 'churn' or one of {METRICS}.")
+        return self.data[METRICS.index(name)]
+
+    def cumulative(self, name: str = "churn") -> np.ndarray:
+        return np.cumsum(self.metric(name), axis=1, dtype=np.int64)
+
+    def rolling(self, window: int, name: str = "churn") -> np.ndarray:
+        """Sum over the last `window` buckets, ending at each bucket (shorter at the start)."""
+        totals = self.cumulative(name)
+        rolled = totals.copy()
+        rolled[:, window:] -= totals[:, :-window]
+        return rolled
+
+    def top(self, n: int, window: int = 1, name: str = "churn"):
+        """Yield `(bucket start, [(module, value), ...])` with the `n` highest modules of every bucket's rolling window."""
+        values = self.rolling(window, name) if window > 1 else self.metric(name)
+        if not len(self.modules):
+            return
+        n = min(n, len(self.modules))
+        # Ties are broken by module order, as argsort is stable.
+        best = np.argsort(-values, axis=0, kind='stable')[:n]
+        for b, start in enumerate(self.bucket_starts.tolist()):
+            yield start, [(self.modules[i], int(values[i, b])) for i in best[:, b].tolist() if values[i, b] > 0]
+
+    def save(self, directory: str):
+        """Write `churn_series.npy` and its labels, `churn_series.json`, into `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "churn_series.npy"), self.data)
+        with open(os.path.join(directory, "churn_series.json"), 'w', encoding='utf-8') as f:
+            json.dump({"metrics": METRICS, "bucket_seconds": self.bucket_seconds, "bucket_starts": self.bucket_starts.tolist(), "modules": self.modules}, f)
+        logger.info(f"Churn series of {len(self.modules)} modules x {len(self.bucket_starts)} buckets saved to '{directory}'.")
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "ChurnSeries":
+        """Read a saved series; with `mmap` the array is memory-mapped read-only instead of loaded."""
+        with open(os.path.join(directory, "churn_series.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+        data = np.load(os.path.join(directory, "churn_series.npy"), mmap_mode='r' if mmap else None)
+        return cls(meta["modules"], meta["bucket_starts"], meta["bucket_seconds"], data)
+
+
+@instrumentation.timed("churn_series")
+def build_churn_series(code_root_folder, since_date, bucket_days: int = 7, index=None) -> ChurnSeries:
+    """Bin the churn of every module since `since_date` into buckets of `bucket_days`, reading `git log` once.
+
+    Buckets start at the window's start, so the last one may be partial.
+    """
+    code_root_folder = Path(code_root_folder)
+    if index is None:
+        index = project_index(code_root_folder, EXCLUDED_DIRS)
+    module_for = module_resolver(code_root_folder, index)
+    start = since_timestamp(code_root_folder, since_date)
+    bucket_seconds = bucket_days * SECONDS_PER_DAY
+    ids = {}
+    line_modules, line_buckets, added_lines, deleted_lines = array('q'), array('q'), array('q'), array('q')
+    commit_modules, commit_buckets = array('q'), array('q')
+
+    for _, timestamp, files in iter_commits(code_root_folder, f'--since={since_date}'):
+        bucket = max(timestamp - start, 0) // bucket_seconds
+        touched = set()
+        for added, deleted, file_path in files:
+            if not file_path.endswith('.py'):
+                continue
+            module = module_for(file_path)
+            if module is None:
+                continue
+            module_id = ids.setdefault(module, len(ids))
+            line_modules.append(module_id)
+            line_buckets.append(bucket)
+            added_lines.append(added)
+            deleted_lines.append(deleted)
+            touched.add(module_id)
+        for module_id in touched:
+            commit_modules.append(module_id)
+            commit_buckets.append(bucket)
+
+    now = int(datetime.now(timezone.utc).timestamp())
+    n_buckets = max(now - start, 0) // bucket_seconds + 1
+    if line_buckets:
+        n_buckets = max(n_buckets, max(line_buckets) + 1)
+    shape = (len(ids), n_buckets)
+    data = np.zeros((len(METRICS), *shape), dtype=np.int32)
+    if line_modules:
+        cells = np.frombuffer(line_modules, dtype=np.int64) * n_buckets + np.frombuffer(line_buckets, dtype=np.int64)
+        for m, values in enumerate((added_lines, deleted_lines)):
+            data[m] = np.bincount(cells, weights=np.frombuffer(values, dtype=np.int64), minlength=shape[0] * n_buckets).reshape(shape)
+        cells = np.frombuffer(commit_modules, dtype=np.int64) * n_buckets + np.frombuffer(commit_buckets, dtype=np.int64)
+        data[2] = np.bincount(cells, minlength=shape[0] * n_buckets).reshape(shape)
+    logger.info(f"Churn series: {len(ids)} modules x {n_buckets} buckets of {bucket_days} days since {since_date}.")
+    return ChurnSeries(list(ids), start + np.arange(n_buckets) * bucket_seconds, bucket_seconds, data)
+
+@instrumentation.timed("rendering")
+def draw_churn_series(series: ChurnSeries, top_n: int = 10, output_file: str = "./img/churn_series.png", dpi=150, formats=None):
+    """Line plot of the cumulative churn of the `top_n` modules with the most churn overall."""
+    import matplotlib.pyplot as plt
+    cumulative = series.cumulative()
+    if not len(series.modules):
+        logger.warning("No modules with churn data to plot.")
+        return []
+    leaders = np.argsort(-cumulative[:, -1], kind='stable')[:top_n]
+    dates = [datetime.fromtimestamp(start, timezone.utc) for start in series.bucket_starts.tolist()]
+    plt.figure(figsize=(12, 6))
+    for i in leaders.tolist():
+        plt.plot(dates, cumulative[i], label=series.modules[i])
+    plt.xlabel('Time')
+    plt.ylabel('Cumulative Churn (Lines Added + Deleted)')
+    plt.title(f"Cumulative Churn of the Top {len(leaders)} Modules")
+    plt.legend(fontsize=7)
+    plt.tight_layout()
+    return save_figure(output_file, dpi, formats, bbox_inches='tight')
@@ -0,0 +1,135 @@
+import logging
+import sqlite3
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+
+import instrumentation
+from churn_metrics import iter_commits
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHURN_STORE_PATH = "./img/churn_store.sqlite"
+
+SECONDS_PER_DAY = 86400
+
+# Commits folded into memory before the daily buckets are flushed to SQLite.
+FLUSH_EVERY = 1000
+
+
+def _git(code_root_folder, *args) -> subprocess.CompletedProcess:
+    return subprocess.run(['git', *args], cwd=code_root_folder, capture_output=True, text=True)
+
+
+class ChurnStore:
+    """Per-day, per-file churn totals of one repository, persisted in SQLite.
+
+    The store remembers the last commit it folded in, so `update` only reads
+    `last_sha..HEAD`. Any `--since` window is then answered from the daily
+    buckets without reading history again; windows are rounded down to whole
+    (UTC) days. If history was rewritten and the last commit is no longer an
+    ancestor of HEAD, the store is rebuilt from scratch.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CHURN_STORE_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS daily_churn (
+                day INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                added INTEGER NOT NULL,
+                deleted INTEGER NOT NULL,
+                commits INTEGER NOT NULL,
+                PRIMARY KEY (day, path)
+            )
+            """
+        )
+        self.conn.commit()
+
+    @property
+    def last_sha(self) -> str | None:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_sha'").fetchone()
+        return row[0] if row else None
+
+    def clear(self):
+        self.conn.execute("DELETE FROM daily_churn")
+        self.conn.execute("DELETE FROM meta")
+        self.conn.commit()
+
+    @instrumentation.timed("churn_store_update")
+    def update(self, code_root_folder) -> int:
+        """Fold the commits made since the last update into the store; return how many were read."""
+        head = _git(code_root_folder, 'rev-parse', 'HEAD')
+        if head.returncode != 0:
+            raise RuntimeError(f"Error running git command: {head.stderr.strip()}")
+        head_sha = head.stdout.strip()
+
+        last_sha = self.last_sha
+        if last_sha == head_sha:
+            return 0
+        if last_sha and _git(code_root_folder, 'merge-base', '--is-ancestor', last_sha, head_sha).returncode != 0:
+            logger.warning(f"Commit {last_sha} is no longer in the history of HEAD; rebuilding the churn store.")
+            self.clear()
+            last_sha = None
+
+        revisions = f'{last_sha}..{head_sha}' if last_sha else head_sha
+        buckets = defaultdict(lambda: [0, 0, 0])
+        new_commits = 0
+        # Flushed buckets and the new `last_sha` are committed together, so a
+        # failed read leaves the store as it was instead of half-updated.
+        try:
+            for _, timestamp, files in iter_commits(code_root_folder, revisions):
+                day = timestamp // SECONDS_PER_DAY
+                for added, deleted, file_path in files:
+                    bucket = buckets[(day, file_path)]
+                    bucket[0] += added
+                    bucket[1] += deleted
+                    bucket[2] += 1
+                new_commits += 1
+                if new_commits % FLUSH_EVERY == 0:
+                    self._flush(buckets)
+
+            self._flush(buckets)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sha', ?)", (head_sha,))
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        logger.info(f"Churn store: folded {new_commits} new commits up to {head_sha[:12]}.")
+        return new_commits
+
+    def _flush(self, buckets):
+        self.conn.executemany(
+            """
+            INSERT INTO daily_churn (day, path, added, deleted, commits) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (day, path) DO UPDATE SET
+                added = added + excluded.added,
+                deleted = deleted + excluded.deleted,
+                commits = commits + excluded.commits
+            """,
+            ((day, path, added, deleted, commits) for (day, path), (added, deleted, commits) in buckets.items()),
+        )
+        buckets.clear()
+
+    def window(self, since: int):
+        """Yield `(path, added, deleted, commits)` summed over the days starting at timestamp `since`."""
+        yield from self.conn.execute(
+            "SELECT path, SUM(added), SUM(deleted), SUM(commits) FROM daily_churn WHERE day >= ? GROUP BY path",
+            (since // SECONDS_PER_DAY,),
+        )
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.conn.rollback()
+        self.close()
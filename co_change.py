@@ -0,0 +1,196 @@
+import heapq
+import logging
+from array import array
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+
+import instrumentation
+from churn_metrics import iter_commits, module_resolver
+from file_utils import EXCLUDED_DIRS, project_index
+
+logger = logging.getLogger(__name__)
+
+# Commits touching more modules than this (mass renames, reformatting) are skipped:
+# they would add a quadratic number of pairs and say little about coupling.
+MAX_COMMIT_MODULES = 50
+
+# Pairs buffered before they are merged into the running counts.
+FLUSH_EVERY = 1_000_000
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter sketch keeping at most `capacity` counters.
+
+    When a new item arrives and all counters are taken, it replaces the item
+    with the smallest count and inherits that count as its error bound, so
+    every reported count overestimates the true one by at most `errors[item]`.
+    Any item whose true count exceeds total / capacity is guaranteed to be kept.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def add(self, item):
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+        elif len(counts) < self.capacity:
+            counts[item] = 1
+            self.errors[item] = 0
+        else:
+            count, victim = self._pop_min()
+            del counts[victim], self.errors[victim]
+            counts[item] = count + 1
+            self.errors[item] = count
+        heapq.heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, key) for key, count in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        # Heap entries go stale when a count grows; skip those whose count is outdated.
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+
+class CoChange:
+    """How often pairs of modules changed in the same commit.
+
+    `counts` is an upper-triangular CSR matrix over `modules` (row < column);
+    `module_commits[i]` counts the commits touching module `i`. With a
+    sketch, `counts` holds only the heavy hitters, `approximate` is set and
+    `errors` bounds the overcount of each of them.
+    """
+
+    def __init__(self, modules, counts, module_commits, commits, skipped_commits, errors=None):
+        self.modules = list(modules)
+        self.counts = counts
+        self.module_commits = module_commits
+        self.commits = commits
+        self.skipped_commits = skipped_commits
+        self.errors = errors
+        self.approximate = errors is not None
+        self._ids = None
+
+    def matrix(self):
+        """Symmetric module x module co-change counts."""
+        return (self.counts + self.counts.T).tocsr()
+
+    def error(self, module_a, module_b) -> int:
+        """Upper bound on the overcount of a pair (0 for exact counts)."""
+        if self.errors is None:
+            return 0
+        if self._ids is None:
+            self._ids = {module: i for i, module in enumerate(self.modules)}
+        a, b = sorted((self._ids[module_a], self._ids[module_b]))
+        return self.errors.get((a, b), 0)
+
+    def pairs(self, min_count: int = 1):
+        """`(module_a, module_b, count, jaccard)` per pair, most frequent first; jaccard is count / commits touching either."""
+        coo = self.counts.tocoo()
+        keep = coo.data >= min_count
+        rows, cols, data = coo.row[keep], coo.col[keep], coo.data[keep]
+        # Sketch counts may overestimate, so the ratio is capped at 1.
+        jaccard = np.minimum(data / np.maximum(self.module_commits[rows] + self.module_commits[cols] - data, 1), 1.0)
+        for k in np.lexsort((cols, rows, -data)).tolist():
+            yield self.modules[rows[k]], self.modules[cols[k]], int(data[k]), float(jaccard[k])
+
+
+def _merge(codes, counts, pending):
+    """Add the buffered pair codes in `pending` to the sorted `(codes, counts)` arrays."""
+    if not pending:
+        return codes, counts
+    new_codes, new_counts = np.unique(np.frombuffer(pending, dtype=np.int64), return_counts=True)
+    merged, inverse = np.unique(np.concatenate([codes, new_codes]), return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate([counts, new_counts]), minlength=len(merged)).astype(np.int64)
+
+@instrumentation.timed("co_change")
+def analyze_co_change(code_root_folder, since_date, index=None, max_commit_modules: int = MAX_COMMIT_MODULES, top_k: int | None = None) -> CoChange:
+    """Count module co-changes over `git log --since=since_date` in one streaming pass.
+
+    Exact counts are merged from a bounded buffer of pair codes into sparse
+    arrays. With `top_k`, a Space-Saving sketch keeps only the `top_k` most
+    frequent pairs in fixed memory instead.
+    """
+    code_root_folder = Path(code_root_folder)
+    if index is None:
+        index = project_index(code_root_folder, EXCLUDED_DIRS)
+    module_for = module_resolver(code_root_folder, index)
+    ids = {}
+    module_commits = array('q')
+    sketch = SpaceSaving(top_k) if top_k else None
+    codes, counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pending = array('q')
+    commits = skipped = 0
+
+    for _, _, files in iter_commits(code_root_folder, f'--since={since_date}'):
+        touched = set()
+        for _, _, file_path in files:
+            if file_path.endswith('.py'):
+                module = module_for(file_path)
+                if module is not None:
+                    touched.add(module)
+        if not touched:
+            continue
+        commits += 1
+        for module in touched:
+            if module not in ids:
+                ids[module] = len(ids)
+                module_commits.append(0)
+            module_commits[ids[module]] += 1
+        if len(touched) > max_commit_modules:
+            skipped += 1
+            continue
+        touched = sorted(ids[module] for module in touched)
+        for a in range(len(touched)):
+            for b in touched[a + 1:]:
+                code = (touched[a] << 32) | b
+                if sketch is None:
+                    pending.append(code)
+                else:
+                    sketch.add(code)
+        if len(pending) >= FLUSH_EVERY:
+            codes, counts = _merge(codes, counts, pending)
+            pending = array('q')
+    codes, counts = _merge(codes, counts, pending)
+
+    errors = None
+    if sketch is not None:
+        items = sorted(sketch.counts)
+        codes = np.array(items, dtype=np.int64)
+        counts = np.array([sketch.counts[code] for code in items], dtype=np.int64)
+        errors = {(int(code >> 32), int(code & 0xFFFFFFFF)): sketch.errors[code] for code in items}
+    n = len(ids)
+    matrix = sp.csr_matrix((counts, (codes >> 32, codes & 0xFFFFFFFF)), shape=(n, n))
+    instrumentation.count("co_change_pairs", matrix.nnz)
+    if skipped:
+        logger.info(f"Skipped {skipped} of {commits} commits touching more than {max_commit_modules} modules.")
+    logger.info(f"Co-change of {n} modules over {commits} commits: {matrix.nnz} pairs{' (top-K sketch)' if sketch else ''}.")
+    return CoChange(list(ids), matrix, np.frombuffer(module_commits, dtype=np.int64) if module_commits else np.empty(0, dtype=np.int64), commits, skipped, errors)
+
+def coupling_records(co_change: CoChange, G, min_count: int = 2):
+    """Co-changing pairs joined with the import graph `G`.
+
+    Each record tells whether either module imports the other; pairs that
+    change together without any import between them are flagged `hidden`.
+    """
+    edges = set(G.edges())
+    for a, b, count, jaccard in co_change.pairs(min_count):
+        a_imports_b, b_imports_a = (a, b) in edges, (b, a) in edges
+        yield {
+            "module_a": a,
+            "module_b": b,
+            "count": count,
+            "jaccard": round(jaccard, 4),
+            "a_imports_b": a_imports_b,
+            "b_imports_a": b_imports_a,
+            "hidden": not (a_imports_b or b_imports_a),
+            **({"max_overcount": co_change.error(a, b)} if co_change.approximate else {}),
+        }
@@ -0,0 +1,188 @@
+import sys
+from array import array
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+from sparse_graph import graph_from_sparse, rollup_adjacency
+
+
+class CompactGraphBuilder:
+    """Accumulates a directed graph as interned names and two flat arrays of integer edge endpoints."""
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.sources = array('q')
+        self.targets = array('q')
+
+    def add_node(self, name) -> int:
+        node_id = self.ids.get(name)
+        if node_id is None:
+            if isinstance(name, str):
+                name = sys.intern(name)
+            node_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return node_id
+
+    def add_edge(self, source, target):
+        self.sources.append(self.add_node(source))
+        self.targets.append(self.add_node(target))
+
+    def build(self) -> "CompactGraph":
+        return CompactGraph.from_edges(
+            self.names,
+            np.frombuffer(self.sources, dtype=np.int64) if self.sources else np.empty(0, dtype=np.int64),
+            np.frombuffer(self.targets, dtype=np.int64) if self.targets else np.empty(0, dtype=np.int64),
+        )
+
+
+class CompactGraph:
+    """Immutable directed graph over integer node ids, with the adjacency in CSR form.
+
+    Node `i` is named `names[i]`; its successors are
+    `indices[indptr[i]:indptr[i + 1]]`, in the order their edges were first
+    added. An edge costs one int32 (plus a transient copy while building)
+    instead of the few hundred bytes of a networkx adjacency entry, and
+    degrees, isolate removal, subgraphs and rollups are array operations.
+    Parallel edges are merged. `nodes`, `edges`, the degree views and
+    `is_directed` read like a DiGraph's, so exports and centrality take
+    either; `to_networkx` gives the equivalent DiGraph, with nodes and edges
+    in the same order, for drawing and ad-hoc analysis.
+    """
+
+    def __init__(self, names, indptr, indices):
+        self.names = list(names)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self._ids = None
+        self._reverse = None
+
+    @classmethod
+    def from_edges(cls, names, sources, targets) -> "CompactGraph":
+        """Graph over `names` with an edge `sources[i] -> targets[i]` (node ids), keeping each edge's first occurrence."""
+        n = len(names)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        _, first = np.unique(sources * max(n, 1) + targets, return_index=True)
+        first.sort()
+        order = first[np.argsort(sources[first], kind='stable')]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources[order], minlength=n), out=indptr[1:])
+        return cls(names, indptr, targets[order])
+
+    @classmethod
+    def from_networkx(cls, G) -> "CompactGraph":
+        builder = CompactGraphBuilder()
+        for node in G:
+            builder.add_node(node)
+        for u, v in G.edges():
+            builder.add_edge(u, v)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    @property
+    def ids(self) -> dict:
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self.names)}
+        return self._ids
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the adjacency arrays (the names are shared, interned strings)."""
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def is_directed(self) -> bool:
+        return True
+
+    def number_of_edges(self) -> int:
+        return len(self.indices)
+
+    def _sources(self):
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+
+    def nodes(self, data=False):
+        """Node names, or `(name, {})` pairs with `data` like `DiGraph.nodes` (nodes carry no attributes)."""
+        return ((name, {}) for name in self.names) if data else iter(self.names)
+
+    def edges(self, data=False):
+        """`(source, target)` name pairs, grouped by source in node order; with `data`, `(source, target, {})` triples."""
+        names = self.names
+        pairs = zip(self._sources().tolist(), self.indices.tolist())
+        if data:
+            return ((names[u], names[v], {}) for u, v in pairs)
+        return ((names[u], names[v]) for u, v in pairs)
+
+    def successors(self, name) -> list:
+        i = self.ids[name]
+        return [self.names[v] for v in self.indices[self.indptr[i]:self.indptr[i + 1]].tolist()]
+
+    def predecessors(self, name) -> list:
+        if self._reverse is None:
+            self._reverse = self.adjacency().T.tocsr()
+        i = self.ids[name]
+        R = self._reverse
+        return [self.names[u] for u in sorted(R.indices[R.indptr[i]:R.indptr[i + 1]].tolist())]
+
+    def out_degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def in_degrees(self) -> np.ndarray:
+        return np.bincount(self.indices, minlength=len(self))
+
+    def out_degree(self) -> dict:
+        return dict(zip(self.names, self.out_degrees().tolist()))
+
+    def in_degree(self) -> dict:
+        return dict(zip(self.names, self.in_degrees().tolist()))
+
+    def degree(self) -> dict:
+        return dict(zip(self.names, (self.out_degrees() + self.in_degrees()).tolist()))
+
+    def adjacency(self):
+        """Unweighted CSR adjacency in node-id order."""
+        n = len(self)
+        return sp.csr_matrix((np.ones(len(self.indices)), self.indices, self.indptr), shape=(n, n))
+
+    def sparse_adjacency(self, nodelist=None):
+        """Adjacency and labels like `sparse_graph.to_sparse_adjacency`: coded in `nodelist` order, or sorted by name."""
+        labels = np.array(sorted(self.names) if nodelist is None else list(nodelist), dtype=object)
+        order = np.fromiter((self.ids[name] for name in labels), dtype=np.int64, count=len(labels))
+        return self.adjacency()[order][:, order].tocsr(), labels
+
+    def subgraph(self, keep) -> "CompactGraph":
+        """Subgraph induced by the node ids where the boolean mask `keep` is set, or by an iterable of names."""
+        if not isinstance(keep, np.ndarray):
+            wanted = set(keep)
+            keep = np.fromiter((name in wanted for name in self.names), dtype=bool, count=len(self))
+        new_ids = np.cumsum(keep) - 1
+        sources = self._sources()
+        kept = keep[sources] & keep[self.indices]
+        names = [name for name, k in zip(self.names, keep.tolist()) if k]
+        # Edges stay in their current order, which is already grouped by source.
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(new_ids[sources[kept]], minlength=len(names)), out=indptr[1:])
+        return CompactGraph(names, indptr, new_ids[self.indices[kept]])
+
+    def without_isolates(self) -> "CompactGraph":
+        """The graph without nodes that have neither in- nor out-edges."""
+        return self.subgraph((self.out_degrees() + self.in_degrees()) > 0)
+
+    def rollup(self, groups):
+        """Weighted graph between the groups given by `groups[i]` for node `i`; see `rollup_adjacency`."""
+        return graph_from_sparse(*rollup_adjacency(self.adjacency(), groups))
+
+    def to_networkx(self) -> nx.DiGraph:
+        G = nx.DiGraph()
+        G.add_nodes_from(self.names)
+        G.add_edges_from(self.edges())
+        return G
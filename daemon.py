@@ -0,0 +1,286 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from centrality import CENTRALITY_MODES, CentralityEngine, top_n_items
+from churn_metrics import add_window_churn, module_resolver, new_module_churn, since_timestamp
+from churn_store import DEFAULT_CHURN_STORE_PATH, ChurnStore
+from compact_graph import CompactGraph
+from file_utils import EXCLUDED_DIRS, project_index
+from import_cache import DEFAULT_CACHE_PATH
+from import_parser import SCANNERS
+from incremental_graph import IncrementalGraph
+from module_trie import MATCH_POLICIES
+from reachability import ReachabilityIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+# Seconds between two scans of the tree for changed files.
+DEFAULT_POLL_INTERVAL = 2.0
+
+CENTRALITY_METRICS = ("betweenness", "in_degree", "out_degree")
+
+
+class QueryError(Exception):
+    """A query that cannot be answered; `status` is the HTTP status to report."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class GraphState:
+    """Dependency graph of one code root kept in memory and answering queries.
+
+    The watcher replaces `graph` with a fresh copy after every update that
+    changed it, so queries read a consistent snapshot without holding the
+    lock while the store mutates its own graph. Derived data (reachability
+    index, centrality) is computed on first use and kept until the next
+    snapshot.
+    """
+
+    def __init__(self, code_root_folder, excluded_dirs=EXCLUDED_DIRS, centrality_engine: CentralityEngine | None = None, churn_store_path: str = DEFAULT_CHURN_STORE_PATH, since_date: str = "6 months ago"):
+        self.code_root_folder = code_root_folder
+        self.excluded_dirs = excluded_dirs
+        self.centrality_engine = centrality_engine or CentralityEngine()
+        self.churn_store_path = churn_store_path
+        self.since_date = since_date
+        self.graph = None
+        self.updates = 0
+        self.updated_at = None
+        self.last_delta = None
+        self._lock = threading.Lock()
+        self._churn_lock = threading.Lock()
+        self._derived = {}
+
+    def publish(self, graph, delta=None):
+        with self._lock:
+            self.graph = graph.copy()
+            self._derived = {}
+            self.updates += 1
+            self.updated_at = time.time()
+            self.last_delta = repr(delta) if delta is not None else None
+
+    def _cached(self, key, compute):
+        # Computed outside the lock, so a slow computation (exact betweenness)
+        # blocks neither other queries nor `publish`; two concurrent misses may
+        # both compute, and a result for a replaced snapshot is not stored.
+        with self._lock:
+            graph, derived = self.graph, self._derived
+            if key in derived:
+                return graph, derived[key]
+        value = compute(graph)
+        with self._lock:
+            if self.graph is graph:
+                value = self._derived.setdefault(key, value)
+        return graph, value
+
+    def module(self, query) -> str:
+        """The module named by a `module=` or (code-root relative) `path=` query parameter."""
+        if "module" in query:
+            return query["module"]
+        if "path" in query:
+            module = project_index(self.code_root_folder, self.excluded_dirs).module_name(os.path.join(self.code_root_folder, query["path"]))
+            if module is None:
+                raise QueryError(f"'{query['path']}' is not a module file.", 404)
+            return module
+        raise QueryError("Expected a 'module' or 'path' parameter.")
+
+    def status(self, query) -> dict:
+        graph = self.graph
+        return {
+            "root": str(self.code_root_folder),
+            "modules": len(graph),
+            "edges": graph.number_of_edges(),
+            "updates": self.updates,
+            "updated_at": self.updated_at,
+            "last_delta": self.last_delta,
+        }
+
+    def _neighbors(self, query, direction) -> dict:
+        module = self.module(query)
+        graph, reachability = self._cached("reachability", lambda G: ReachabilityIndex.build(CompactGraph.from_networkx(G)))
+        if module not in graph:
+            raise QueryError(f"Module '{module}' is not in the dependency graph.", 404)
+        if query.get("transitive", "0") not in ("0", "false", ""):
+            related = reachability.descendants(module) if direction == "dependencies" else reachability.ancestors(module)
+        else:
+            related = graph.successors(module) if direction == "dependencies" else graph.predecessors(module)
+        return {"module": module, direction: sorted(related), "in_cycle": reachability.in_cycle(module)}
+
+    def dependencies(self, query) -> dict:
+        return self._neighbors(query, "dependencies")
+
+    def dependents(self, query) -> dict:
+        return self._neighbors(query, "dependents")
+
+    def centrality(self, query) -> dict:
+        metric = query.get("metric", "betweenness")
+        if metric not in CENTRALITY_METRICS:
+            raise QueryError(f"Unknown metric '{metric}', expected one of {CENTRALITY_METRICS}.")
+        top = _int_param(query, "top", 20)
+        graph, betweenness = self._cached("betweenness", self.centrality_engine.betweenness)
+        scores = {"betweenness": betweenness, "in_degree": dict(graph.in_degree()), "out_degree": dict(graph.out_degree())}
+        return {
+            "metric": metric,
+            "top": [
+                {"module": module, **{name: values.get(module, 0) for name, values in scores.items()}}
+                for module, _ in top_n_items(scores[metric], top)
+            ],
+        }
+
+    def churn(self, query) -> dict:
+        """Churn since `since` of one module, or the `top` modules by churn; history comes from the churn store."""
+        since = query.get("since", self.since_date)
+        index = project_index(self.code_root_folder, self.excluded_dirs)
+        # One SQLite connection per request, as handler threads cannot share one.
+        with self._churn_lock, ChurnStore(self.churn_store_path) as store:
+            store.update(self.code_root_folder)
+            try:
+                rows = store.window(since_timestamp(self.code_root_folder, since))
+            except ValueError as e:
+                raise QueryError(str(e))
+            module_churn = new_module_churn()
+            add_window_churn(module_churn, rows, module_resolver(Path(self.code_root_folder), index))
+        if "module" in query or "path" in query:
+            module = self.module(query)
+            return {"module": module, "since": since, **module_churn.get(module, {"added": 0, "deleted": 0, "commits": 0})}
+        totals = {module: stats['added'] + stats['deleted'] for module, stats in module_churn.items()}
+        return {
+            "since": since,
+            "top": [{"module": module, **module_churn[module]} for module, _ in top_n_items(totals, _int_param(query, "top", 20))],
+        }
+
+
+def _int_param(query, name, default) -> int:
+    try:
+        return int(query.get(name, default))
+    except ValueError:
+        raise QueryError(f"Parameter '{name}' must be an integer.")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """GET /<endpoint>?<params> on a GraphState, answered as JSON."""
+
+    endpoints = ("status", "dependencies", "dependents", "centrality", "churn")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.strip("/")
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        start = time.perf_counter()
+        try:
+            if endpoint not in self.endpoints:
+                raise QueryError(f"Unknown endpoint '/{endpoint}', expected one of {['/' + name for name in self.endpoints]}.", 404)
+            body, status = getattr(self.server.state, endpoint)(query), 200
+        except QueryError as e:
+            body, status = {"error": str(e)}, e.status
+        except Exception as e:
+            logger.exception(f"Query '{self.path}' failed.")
+            body, status = {"error": f"{type(e).__name__}: {e}"}, 500
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        logger.debug(f"{self.path} answered in {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve(
+    code_root_folder: str,
+    cache_path: str = DEFAULT_CACHE_PATH,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    interval: float = DEFAULT_POLL_INTERVAL,
+    excluded_dirs=EXCLUDED_DIRS,
+    jobs: int | None = 1,
+    match_policy: str = "package",
+    scanner: str = "ast",
+    centrality_engine: CentralityEngine | None = None,
+    churn_store_path: str = DEFAULT_CHURN_STORE_PATH,
+    since_date: str = "6 months ago",
+    stop: threading.Event | None = None,
+):
+    """Keep the graph of `code_root_folder` up to date and answer queries on http://host:port until `stop` is set.
+
+    The tree is rescanned every `interval` seconds; changed files are
+    detected by size and mtime and only their imports are re-parsed (see
+    IncrementalGraph). The graph store lives in the import cache at
+    `cache_path`, so a restarted daemon also starts from the last state.
+    """
+    stop = stop or threading.Event()
+    state = GraphState(code_root_folder, excluded_dirs, centrality_engine=centrality_engine, churn_store_path=churn_store_path, since_date=since_date)
+    with IncrementalGraph(code_root_folder, cache_path, excluded_dirs=excluded_dirs, jobs=jobs, match_policy=match_policy, scanner=scanner) as store:
+        store.update("mtime")
+        state.publish(store.graph)
+        server = ThreadingHTTPServer((host, port), QueryHandler)
+        server.daemon_threads = True
+        server.state = state
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        logger.info(f"Serving the dependency graph of '{code_root_folder}' on http://{server.server_address[0]}:{server.server_address[1]}/.")
+        try:
+            while not stop.wait(interval):
+                try:
+                    delta = store.update("mtime")
+                except Exception as e:
+                    logger.error(f"Graph update failed: {e}")
+                    continue
+                if delta:
+                    state.publish(store.graph, delta)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Keep a code base's dependency graph in memory and answer queries over local HTTP.")
+    parser.add_argument("code_root", help="Root folder of the code base to watch.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite file holding the import cache and the persisted graph.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on (0 = any free port).")
+    parser.add_argument("--interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between scans for changed files.")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes used to parse files (0 = all cores).")
+    parser.add_argument("--match-policy", choices=MATCH_POLICIES, default="package", help="How import targets are matched against the project's modules.")
+    parser.add_argument("--scanner", choices=SCANNERS, default="ast", help="Import extraction: full AST, lexical scan of import statements, or lexical without function bodies.")
+    parser.add_argument("--churn-store", default=DEFAULT_CHURN_STORE_PATH, help="SQLite file keeping incremental churn totals for /churn queries.")
+    parser.add_argument("--since", default="6 months ago", help="Default churn window of /churn queries.")
+    parser.add_argument("--centrality", choices=CENTRALITY_MODES, default="exact", help="Betweenness algorithm: exact, sampled pivots, or exact split across --jobs processes.")
+    parser.add_argument("--centrality-k", type=int, default=256, help="Number of pivot sources in sampled mode.")
+    parser.add_argument("--centrality-seed", type=int, default=0, help="Random seed for choosing the sampled pivots.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    serve(
+        args.code_root,
+        cache_path=args.cache,
+        host=args.host,
+        port=args.port,
+        interval=args.interval,
+        jobs=args.jobs,
+        match_policy=args.match_policy,
+        scanner=args.scanner,
+        centrality_engine=CentralityEngine(args.centrality, k=args.centrality_k, seed=args.centrality_seed, jobs=args.jobs),
+        churn_store_path=args.churn_store,
+        since_date=args.since,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import csv
+import json
+import logging
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("jsonl", "graphml", "csv")
+
+_GRAPHML_TYPES = ((bool, "boolean"), (int, "long"), (float, "double"))
+
+
+@instrumentation.timed("export")
+def write_jsonl(records, path: str) -> int:
+    """Write an iterable of dicts as JSON lines, one record at a time; return the number written."""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, default=str))
+            f.write('\n')
+            count += 1
+    return count
+
+def graph_records(G):
+    """Yield one JSON-serializable record per node, then one per edge, with their attributes."""
+    for node, data in G.nodes(data=True):
+        yield {"type": "node", "id": node, **data}
+    for u, v, data in G.edges(data=True):
+        yield {"type": "edge", "source": u, "target": v, **data}
+
+def write_edge_csv(G, path: str) -> int:
+    """Write the edge list of `G` as CSV with a `source,target` header plus one column per edge attribute."""
+    attributes = sorted({key for _, _, data in G.edges(data=True) for key in data})
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["source", "target", *attributes])
+        for u, v, data in G.edges(data=True):
+            writer.writerow([u, v, *(data.get(key, "") for key in attributes)])
+            count += 1
+    return count
+
+def _graphml_keys(items, domain):
+    """GraphML `<key>` declarations for the attributes found in `items`, typed by their first value."""
+    keys = {}
+    for data in items:
+        for name, value in data.items():
+            if name not in keys:
+                keys[name] = next((graphml_type for python_type, graphml_type in _GRAPHML_TYPES if isinstance(value, python_type)), "string")
+    return {name: (f"{domain[0]}{i}", graphml_type) for i, (name, graphml_type) in enumerate(sorted(keys.items()))}
+
+def _graphml_data(data, keys):
+    return "".join(f'<data key="{keys[name][0]}">{escape(str(value).lower() if isinstance(value, bool) else str(value))}</data>' for name, value in data.items())
+
+def write_graphml(G, path: str) -> int:
+    """Write `G` as GraphML element by element instead of building the XML tree in memory."""
+    node_keys = _graphml_keys((data for _, data in G.nodes(data=True)), "node")
+    edge_keys = _graphml_keys((data for _, _, data in G.edges(data=True)), "edge")
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for domain, keys in (("node", node_keys), ("edge", edge_keys)):
+            for name, (key_id, graphml_type) in keys.items():
+                f.write(f'  <key id="{key_id}" for="{domain}" attr.name={quoteattr(str(name))} attr.type="{graphml_type}"/>\n')
+        f.write(f'  <graph edgedefault="{"directed" if G.is_directed() else "undirected"}">\n')
+        for node, data in G.nodes(data=True):
+            f.write(f'    <node id={quoteattr(str(node))}>{_graphml_data(data, node_keys)}</node>\n')
+        for u, v, data in G.edges(data=True):
+            f.write(f'    <edge source={quoteattr(str(u))} target={quoteattr(str(v))}>{_graphml_data(data, edge_keys)}</edge>\n')
+            count += 1
+        f.write('  </graph>\n</graphml>\n')
+    return count
+
+@instrumentation.timed("export")
+def export_graph(G, directory: str, name: str, formats=EXPORT_FORMATS) -> list[str]:
+    """Write `G` to `<directory>/<name>.<ext>` in each of `formats` and return the paths written."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}.")
+        path = os.path.join(directory, f"{name}.{fmt}")
+        if fmt == "jsonl":
+            write_jsonl(graph_records(G), path)
+        elif fmt == "graphml":
+            write_graphml(G, path)
+        else:
+            write_edge_csv(G, path)
+        paths.append(path)
+    logger.info(f"Exported '{name}' ({len(G)} nodes, {G.number_of_edges()} edges) to {', '.join(paths)}.")
+    return paths
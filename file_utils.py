@@ -1,59 +1,376 @@
 from pathlib import Path
+import os
 import re
+import itertools
 import logging
+import subprocess
+import time
+
+import instrumentation
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def module_name_from_file_path(full_path: str, code_root_folder: str, strict: bool = False, excluded_dirs: set[str] | None = None) -> str | None:
+EXCLUDED_DIRS = frozenset({"_pyinstaller", "tools", "doc", "benchmarks", "ci", "wheels", "swig"})
 
-    full_path = Path(full_path).resolve()
-    code_root_folder = Path(code_root_folder).resolve()
+# Version-control metadata and tool caches, never part of a code base.
+PRUNED_DIRS = frozenset({".git", ".hg", ".svn", "__pycache__", ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".eggs", "node_modules"})
 
-    if not full_path.is_file():
-        return None
-    if not code_root_folder.is_dir():
-        raise ValueError(f"Code root '{code_root_folder}' is not a directory.")
+# "walk" scans the tree, pruning excluded, ignored and environment folders;
+# "git" enumerates the tracked files with `git ls-files`.
+DISCOVERY_BACKENDS = ("walk", "git")
 
-    try:
-        relative_path = full_path.relative_to(code_root_folder)
-    except ValueError:
-        return None
 
-    if excluded_dirs and any(part in excluded_dirs for part in relative_path.parts):
+def _module_name_from_relative_path(relative_path: str) -> str | None:
+    relative_path_str = relative_path
+    if relative_path_str.endswith(os.sep + "__init__.py"):
+        relative_path_str = relative_path_str[:-len(os.sep + "__init__.py")]
+
+    if not (relative_path_str.endswith(".py") or os.path.basename(relative_path) == "__init__.py"):
         return None
 
-    is_package_file = False
-    parent = full_path.parent
-    while parent != code_root_folder and parent != parent.parent:  
-        if (parent / "__init__.py").is_file():
-            is_package_file = True
-            break
-        parent = parent.parent
+    if relative_path_str.endswith(".py"):
+        relative_path_str = relative_path_str[:-3]
 
-    if not is_package_file and full_path.name != "__init__.py":
-        return None
+    module_name = re.sub(r"[/\\]", ".", relative_path_str).strip(".")
+    return module_name or None
 
-    relative_path_str = str(relative_path)
 
-    if relative_path_str.endswith("/__init__.py"):
-        relative_path_str = relative_path_str[:-len("/__init__.py")]
+def _gitignore_regex(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression over `/`-separated paths."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == n:
+            out.append("/.*")
+            i += 3
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[" and pattern.find("]", i + 2) != -1:
+            j = pattern.find("]", i + 2)
+            body = pattern[i + 1:j]
+            out.append("[" + ("^" + body[1:] if body.startswith("!") else body).replace("\\", "\\\\") + "]")
+            i = j + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
 
-    if not (relative_path_str.endswith(".py") or relative_path.name == "__init__.py"):
-        return None
 
-    if relative_path_str.endswith(".py"):
-        relative_path_str = relative_path_str[:-3]
+class _IgnoreRules:
+    """The patterns of one `.gitignore` (or `.git/info/exclude`), applying to the folders below `base`."""
 
-    module_name = re.sub(r"[/\\]", ".", relative_path_str).strip(".")
+    def __init__(self, base: str, lines):
+        self.prefix = base.replace(os.sep, "/") + "/" if base else ""
+        self.patterns = []
+        for line in lines:
+            line = line.rstrip("\r\n").rstrip(" ")
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated or line.startswith(("\\!", "\\#")):
+                line = line[1:]
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            regex = _gitignore_regex(line.lstrip("/"))
+            self.patterns.append((re.compile(regex if anchored else "(?:.*/)?" + regex), negated))
+
+    @classmethod
+    def read(cls, file_path: str, base: str) -> "_IgnoreRules | None":
+        try:
+            with open(file_path, encoding='utf-8', errors='replace') as f:
+                rules = cls(base, f)
+        except OSError:
+            return None
+        return rules if rules.patterns else None
 
-    if not module_name:
+    def match(self, relative_dir: str) -> bool | None:
+        """True if the folder is ignored, False if a `!` pattern re-includes it, None if no pattern applies."""
+        path = relative_dir[len(self.prefix):]
+        for regex, negated in reversed(self.patterns):
+            if regex.fullmatch(path):
+                return not negated
         return None
 
-    if not all(part.isidentifier() for part in module_name.split(".")):
-        if strict:
-            raise ValueError(f"Invalid module name '{module_name}' derived from path '{full_path}'.")
+
+def _ignored(rules, relative_dir: str) -> bool:
+    # The deepest file decides; `.git/info/exclude` comes first, so it has the lowest precedence.
+    relative_dir = relative_dir.replace(os.sep, "/")
+    for file_rules in reversed(rules):
+        if relative_dir.startswith(file_rules.prefix):
+            ignored = file_rules.match(relative_dir)
+            if ignored is not None:
+                return ignored
+    return False
+
+def walk_directories(code_root_folder, excluded_dirs=(), gitignore: bool = True):
+    """Yield `(relative folder, sorted file names)` for the folders below a code root, top-down like a sorted `os.walk`.
+
+    Folders named in `excluded_dirs` or `PRUNED_DIRS`, virtual environments
+    (holding a `pyvenv.cfg` or `conda-meta`) and, with `gitignore`, folders
+    ignored by a `.gitignore` or `.git/info/exclude` are pruned before being
+    listed. Each folder costs one `os.scandir`; symlinked folders are not followed.
+    """
+    root = str(code_root_folder)
+    pruned = PRUNED_DIRS | frozenset(excluded_dirs)
+    rules = ()
+    if gitignore:
+        exclude = _IgnoreRules.read(os.path.join(root, ".git", "info", "exclude"), "")
+        rules = (exclude,) if exclude else ()
+    stack = [("", rules)]
+    while stack:
+        rel_dir, rules = stack.pop()
+        dir_path = os.path.join(root, rel_dir) if rel_dir else root
+        files, dirs = [], []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        files.append(entry.name)
+                    elif not entry.is_symlink():
+                        dirs.append(entry.name)
+        except OSError as e:
+            logger.debug(f"Cannot list '{dir_path}': {e}")
+            continue
+        if rel_dir and ("pyvenv.cfg" in files or "conda-meta" in dirs):
+            logger.debug(f"Skipping virtual environment '{rel_dir}'.")
+            continue
+        if gitignore and ".gitignore" in files:
+            own = _IgnoreRules.read(os.path.join(dir_path, ".gitignore"), rel_dir)
+            if own is not None:
+                rules = rules + (own,)
+        files.sort()
+        yield rel_dir, files
+        children = []
+        for name in sorted(dirs):
+            child = os.path.join(rel_dir, name) if rel_dir else name
+            if name not in pruned and not (rules and _ignored(rules, child)):
+                children.append((child, rules))
+        stack.extend(reversed(children))
+
+def git_files(code_root_folder) -> list[str]:
+    """Root-relative paths of the files git tracks below a code root (minus those deleted from the work tree), from `git ls-files -z`."""
+    def ls_files(*args):
+        result = subprocess.run(['git', 'ls-files', '-z', *args], cwd=code_root_folder, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Error running git ls-files: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return [path for path in result.stdout.decode('utf-8', 'surrogateescape').split('\0') if path]
+
+    deleted = set(ls_files('--deleted'))
+    return [path for path in ls_files() if path not in deleted]
+
+def group_by_directory(paths, excluded_dirs=()):
+    """Group root-relative file paths (`/` or `os.sep` separated) into the `(relative folder, sorted file names)` of `walk_directories`, in its order.
+
+    Files below excluded or pruned folders and below virtual environments are dropped.
+    """
+    pruned = PRUNED_DIRS | frozenset(excluded_dirs)
+    split = [path.replace("/", os.sep).split(os.sep) for path in paths]
+    environments = {tuple(parts[:-1]) for parts in split if parts[-1] == "pyvenv.cfg"}
+    environments |= {tuple(parts[:parts.index("conda-meta")]) for parts in split if "conda-meta" in parts[:-1]}
+    kept = [
+        parts for parts in split
+        if not any(part in pruned for part in parts[:-1])
+        and not (environments and any(tuple(parts[:k]) in environments for k in range(1, len(parts))))
+    ]
+    # The order of a top-down walk: a folder's files, then its sorted subfolders.
+    kept.sort(key=lambda parts: [(1, part) for part in parts[:-1]] + [(0, parts[-1])])
+    for directory, group in itertools.groupby(kept, key=lambda parts: parts[:-1]):
+        yield os.sep.join(directory), [parts[-1] for parts in group]
+
+
+class ProjectIndex:
+    """In-memory map of the modules below a code root, built from a single pass of discovery.
+
+    Discovery prunes `excluded_dirs` (see `walk_directories` or, with
+    `discovery="git"`, `git_files`), records every package directory (one
+    that holds an `__init__.py`) and derives the module name of each `.py`
+    file once, so later lookups never touch the filesystem. With `defer`,
+    nothing is read until `discover` or `finish` is called.
+    """
+
+    def __init__(self, code_root_folder: str, excluded_dirs: set[str] | None = None, paths=None, discovery: str = "walk", defer: bool = False):
+        if discovery not in DISCOVERY_BACKENDS:
+            raise ValueError(f"Unknown discovery '{discovery}', expected one of {DISCOVERY_BACKENDS}.")
+        self.root = Path(code_root_folder).resolve()
+        if paths is None and not self.root.is_dir():
+            raise ValueError(f"Code root '{self.root}' is not a directory.")
+        self._root_prefixes = {str(self.root) + os.sep, os.path.abspath(code_root_folder) + os.sep}
+        self.excluded_dirs = frozenset(excluded_dirs or ())
+        self.discovery = discovery
+        self.package_dirs: set[str] = set()
+        self.path_to_module: dict[str, str] = {}
+        self._invalid: dict[str, str] = {}
+        self._paths = paths
+        self.complete = False
+        if not defer:
+            self.finish()
+
+    @classmethod
+    def from_paths(cls, code_root_folder: str, paths, excluded_dirs: set[str] | None = None) -> "ProjectIndex":
+        """Index a given list of root-relative file paths (e.g. a git tree listing) instead of walking the filesystem.
+
+        Paths may use `/` separators; the result is the same as walking a
+        checkout holding exactly these files.
+        """
+        return cls(code_root_folder, excluded_dirs, paths=paths)
+
+    @instrumentation.timed("discovery")
+    def finish(self) -> "ProjectIndex":
+        """Run discovery to the end, unless it already completed."""
+        for _ in self.discover():
+            pass
+        return self
+
+    def discover(self):
+        """Yield `(absolute path, module name)` for every module file as discovery finds it, in walk order.
+
+        The index fills up along the way and is `complete` once the generator
+        is exhausted, so callers can start on the first modules while the
+        tree is still being listed. A completed index replays `modules()`.
+        """
+        if self.complete:
+            yield from self.modules()
+            return
+        self.package_dirs.clear()
+        self.path_to_module.clear()
+        self._invalid.clear()
+        if self._paths is not None:
+            directories = group_by_directory(self._paths, self.excluded_dirs)
+        elif self.discovery == "git":
+            directories = group_by_directory(git_files(self.root), self.excluded_dirs)
         else:
+            directories = walk_directories(self.root, self.excluded_dirs)
+        scanned = 0
+        for rel_dir, filenames in directories:
+            scanned += len(filenames)
+            if "__init__.py" in filenames and rel_dir:
+                self.package_dirs.add(rel_dir)
+            for name in filenames:
+                if name.endswith(".py") and name not in self.excluded_dirs:
+                    relative_path = os.path.join(rel_dir, name)
+                    module_name = self._add(relative_path)
+                    if module_name is not None:
+                        yield str(self.root / relative_path), module_name
+        instrumentation.count("files_scanned", scanned)
+        instrumentation.count("modules_indexed", len(self.path_to_module))
+        self.complete = True
+
+    def _add(self, relative_path: str) -> str | None:
+        if not self._in_package(relative_path) and os.path.basename(relative_path) != "__init__.py":
             return None
+        module_name = _module_name_from_relative_path(relative_path)
+        if module_name is None:
+            return None
+        if all(part.isidentifier() for part in module_name.split(".")):
+            self.path_to_module[relative_path] = module_name
+            return module_name
+        self._invalid[relative_path] = module_name
+        return None
+
+    def _in_package(self, relative_path: str) -> bool:
+        parent = os.path.dirname(relative_path)
+        while parent:
+            if parent in self.package_dirs:
+                return True
+            parent = os.path.dirname(parent)
+        return False
+
+    def _relative(self, full_path: str) -> str | None:
+        full_path = os.path.abspath(full_path)
+        for prefix in self._root_prefixes:
+            if full_path.startswith(prefix):
+                return full_path[len(prefix):]
+        return None
+
+    def module_name(self, full_path: str, strict: bool = False) -> str | None:
+        """Return the dotted module name of `full_path`, or None if it is not a module file."""
+        relative_path = self._relative(full_path)
+        if relative_path is None:
+            resolved = os.path.realpath(full_path)
+            relative_path = self._relative(resolved)
+            if relative_path is None:
+                return None
 
-    return module_name
\ No newline at end of file
+        module_name = self.path_to_module.get(relative_path)
+        if module_name is None and strict and relative_path in self._invalid:
+            raise ValueError(f"Invalid module name '{self._invalid[relative_path]}' derived from path '{self.root / relative_path}'.")
+        return module_name
+
+    def module_for_import(self, imported_name: str) -> str | None:
+        """Map an imported dotted name to a module if it has a `.py` file of its own."""
+        return self.path_to_module.get(imported_name.replace(".", os.sep) + ".py")
+
+    def modules(self):
+        """Yield `(absolute path, module name)` for every module file, in walk order."""
+        for relative_path, module_name in self.path_to_module.items():
+            yield str(self.root / relative_path), module_name
+
+
+_project_indexes: dict[tuple[str, frozenset[str], str], ProjectIndex] = {}
+
+def _index_key(code_root_folder, excluded_dirs, discovery) -> tuple[str, frozenset[str], str]:
+    return os.path.abspath(code_root_folder), frozenset(excluded_dirs or ()), discovery
+
+def project_index(code_root_folder: str, excluded_dirs: set[str] | None = None, discovery: str = "walk") -> ProjectIndex:
+    """Return the shared ProjectIndex for a code root, walking it on first use."""
+    key = _index_key(code_root_folder, excluded_dirs, discovery)
+    index = _project_indexes.get(key)
+    if index is None:
+        index = _project_indexes[key] = ProjectIndex(code_root_folder, excluded_dirs, discovery=discovery)
+    return index
+
+def refresh_project_index(code_root_folder: str, excluded_dirs: set[str] | None = None, discovery: str = "walk") -> ProjectIndex:
+    """Walk a code root again and make the new index the shared one."""
+    key = _index_key(code_root_folder, excluded_dirs, discovery)
+    index = _project_indexes[key] = ProjectIndex(code_root_folder, excluded_dirs, discovery=discovery)
+    return index
+
+def stream_project_index(code_root_folder: str, excluded_dirs: set[str] | None = None, discovery: str = "walk") -> tuple[ProjectIndex, object]:
+    """Return the ProjectIndex of a code root and an iterator over its `(absolute path, module name)` pairs.
+
+    If the root is not indexed yet, the pairs come from `ProjectIndex.discover`
+    while the walk runs, and the index becomes the shared one once they are
+    exhausted; until then it is incomplete. The time spent discovering, between
+    the consumer's own work, is recorded as the "discovery" stage.
+    """
+    key = _index_key(code_root_folder, excluded_dirs, discovery)
+    index = _project_indexes.get(key)
+    if index is not None:
+        return index, index.modules()
+    index = ProjectIndex(code_root_folder, excluded_dirs, discovery=discovery, defer=True)
+
+    def pairs():
+        first = resumed = time.perf_counter()
+        seconds = 0.0
+        for pair in index.discover():
+            seconds += time.perf_counter() - resumed
+            yield pair
+            resumed = time.perf_counter()
+        seconds += time.perf_counter() - resumed
+        instrumentation.record("discovery", first, seconds)
+        _project_indexes[key] = index
+    return index, pairs()
+
+def clear_project_indexes():
+    """Forget every shared ProjectIndex so the next lookup walks the tree again."""
+    _project_indexes.clear()
+
+def module_name_from_file_path(full_path: str, code_root_folder: str, strict: bool = False, excluded_dirs: set[str] | None = None) -> str | None:
+    return project_index(code_root_folder, excluded_dirs).module_name(full_path, strict=strict)
@@ -1,96 +1,191 @@
 import networkx as nx
-from pathlib import Path
-import matplotlib.pyplot as plt
-from file_utils import module_name_from_file_path
-from import_parser import imports_from_file
-
-
-def dependencies_digraph(code_root_folder: str) -> nx.DiGraph:
-    files = list(Path(code_root_folder).rglob("*.py"))
-    G = nx.DiGraph()
-    excluded_dirs = {"_pyinstaller", "tools", "doc", "benchmarks", "ci", "wheels", "swig"}
-
-    valid_modules = set()
-    for file in files:
-        file_path = str(file)
-        module_name = module_name_from_file_path(file_path, code_root_folder, strict=False, excluded_dirs=excluded_dirs)
-        if module_name is not None:
-            valid_modules.add(module_name)
-
-    for file in files:
-        file_path = str(file)
-        source_module = module_name_from_file_path(file_path, code_root_folder, strict=False, excluded_dirs=excluded_dirs)
-        if source_module is None:
-            continue
-
-        G.add_node(source_module)
-
-        for target_module in imports_from_file(file_path, code_root_folder, excluded_dirs=excluded_dirs):
-            target_base = target_module.split('.')[0]
-            if any(target_module.startswith(vm) or target_base == vm.split('.')[0] for vm in valid_modules):
-                G.add_edge(source_module, target_module)
-
-    isolated = list(nx.isolates(G))
-    G.remove_nodes_from(isolated)
-
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import instrumentation
+from file_utils import EXCLUDED_DIRS, stream_project_index
+from import_parser import parse_file, resolve_imports
+from import_cache import ImportCache
+from module_trie import ModuleTrie
+from centrality import CentralityEngine, top_n_items
+from compact_graph import CompactGraph, CompactGraphBuilder
+from layout_cache import LayoutCache, graph_layout
+from rendering import save_figure
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the number of files handed to a worker process at once.
+MAX_CHUNK_SIZE = 64
+
+
+def parse_chunk_unresolved(job):
+    """Parse a `(chunk, scanner)` job of `(path, source_module)` pairs without resolving it; run in pool workers."""
+    chunk, scanner = job
+    return [parse_file(file_path, source_module, scanner=scanner) for file_path, source_module in chunk]
+
+def chunk_size_for(n_files: int, jobs: int) -> int:
+    return max(1, min(MAX_CHUNK_SIZE, -(-n_files // (jobs * 4))))
+
+@instrumentation.timed("parsing")
+def collect_imports(modules, index, cache: ImportCache | None = None, jobs: int | None = 1, scanner: str = "ast") -> list[list[str]]:
+    """Return the resolved imports of each `(path, source_module)` pair, in input order.
+
+    Files missing from the cache are parsed serially when `jobs` is 1, or in
+    chunks on a process pool of `jobs` workers (all cores when None).
+    `modules` may be a generator still discovering files (see
+    `stream_project_index`): pairs are looked up and parsed, or sent to the
+    pool, as they arrive, and resolved against `index` once it is exhausted.
+    As their number is unknown, chunks then start at one file and double
+    after every round of `jobs` chunks, up to MAX_CHUNK_SIZE, so small trees
+    still spread over all workers.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    sized = hasattr(modules, "__len__")
+    chunk_size = chunk_size_for(len(modules), jobs) if sized else 1
+    all_imports = []
+    pending, results, chunk, futures = [], [], [], []
+    pool = None
+    try:
+        for i, (file_path, source_module) in enumerate(modules):
+            imports = cache.lookup(file_path, source_module, scanner) if cache is not None else None
+            all_imports.append(imports)
+            if imports is not None:
+                continue
+            pending.append((i, file_path, source_module))
+            if jobs == 1:
+                results.append(parse_file(file_path, source_module, scanner=scanner))
+                continue
+            chunk.append((file_path, source_module))
+            if len(chunk) == chunk_size:
+                pool = pool or ProcessPoolExecutor(max_workers=jobs)
+                futures.append(pool.submit(parse_chunk_unresolved, (chunk, scanner)))
+                chunk = []
+                if not sized and len(futures) % jobs == 0:
+                    chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+        if chunk and pool is None and len(chunk) == 1:
+            results.append(parse_file(*chunk[0], scanner=scanner))
+        elif chunk:
+            pool = pool or ProcessPoolExecutor(max_workers=jobs)
+            futures.append(pool.submit(parse_chunk_unresolved, (chunk, scanner)))
+        for future in futures:
+            results.extend(future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    instrumentation.count("files_parsed", len(pending))
+    instrumentation.count("cache_hits", len(all_imports) - len(pending))
+    for (i, file_path, source_module), (imports, size, mtime_ns, digest) in zip(pending, results):
+        if cache is not None:
+            cache.store(file_path, source_module, imports, size, mtime_ns, digest, scanner)
+        all_imports[i] = imports
+    return [resolve_imports(imports, index) for imports in all_imports]
+
+
+@instrumentation.timed("graph_build")
+def build_compact_dependency_graph(code_root_folder: str, cache_path: str | None = None, excluded_dirs=EXCLUDED_DIRS, jobs: int | None = 1, match_policy: str = "package", scanner: str = "ast", discovery: str = "walk") -> CompactGraph:
+    """Build the file-level import graph of a code root as a CompactGraph, without drawing it.
+
+    An import becomes an edge when its target matches the project's modules
+    under `match_policy` (see ModuleTrie); the default keeps any target in the
+    same top-level package as a project module. Files are parsed while
+    `discovery` (see ProjectIndex) is still listing the tree.
+    """
+    index, discovered = stream_project_index(code_root_folder, excluded_dirs, discovery)
+
+    cache = ImportCache(cache_path) if cache_path else None
+    all_targets = collect_imports(discovered, index, cache=cache, jobs=jobs, scanner=scanner)
+    modules = list(index.modules())
+    valid_modules = ModuleTrie(index.path_to_module.values())
+    graph = compact_graph_from_imports(modules, all_targets, valid_modules, match_policy)
+
+    if cache is not None:
+        cache.report()
+        cache.close()
+    return graph
+
+def build_dependency_graph(code_root_folder: str, cache_path: str | None = None, excluded_dirs=EXCLUDED_DIRS, jobs: int | None = 1, match_policy: str = "package", scanner: str = "ast", discovery: str = "walk") -> nx.DiGraph:
+    """`build_compact_dependency_graph` as a networkx DiGraph."""
+    return build_compact_dependency_graph(code_root_folder, cache_path=cache_path, excluded_dirs=excluded_dirs, jobs=jobs, match_policy=match_policy, scanner=scanner, discovery=discovery).to_networkx()
+
+def compact_graph_from_imports(modules, all_targets, valid_modules: ModuleTrie, match_policy: str = "package") -> CompactGraph:
+    """Graph of the resolved imports of each `(path, source_module)` pair that match `valid_modules`, without isolated nodes."""
+    builder = CompactGraphBuilder()
+    with instrumentation.stage("edge_filtering"):
+        kept = 0
+        for (file_path, source_module), targets in zip(modules, all_targets):
+            builder.add_node(source_module)
+
+            for target_module in targets:
+                if valid_modules.matches(target_module, match_policy):
+                    builder.add_edge(source_module, target_module)
+                    kept += 1
+        instrumentation.count("edges_kept", kept)
+        instrumentation.count("edges_dropped", sum(map(len, all_targets)) - kept)
+
+    return builder.build().without_isolates()
+
+def graph_from_imports(modules, all_targets, valid_modules: ModuleTrie, match_policy: str = "package") -> nx.DiGraph:
+    return compact_graph_from_imports(modules, all_targets, valid_modules, match_policy).to_networkx()
+
+def dependencies_digraph(code_root_folder: str, cache_path: str | None = None, jobs: int | None = 1) -> nx.DiGraph:
+    G = build_dependency_graph(code_root_folder, cache_path=cache_path, jobs=jobs)
     draw_graph(G)
     return G
-    
-def dependencies_digraph_centrality(code_root_folder: str, top_n) -> nx.DiGraph:
-   
-    files = list(Path(code_root_folder).rglob("*.py"))
-    G = nx.DiGraph()
-    excluded_dirs = {"_pyinstaller", "tools", "doc", "benchmarks", "ci", "wheels", "swig"}
-
-    valid_modules = set()
-    for file in files:
-        file_path = str(file)
-        module_name = module_name_from_file_path(file_path, code_root_folder, strict=False, excluded_dirs=excluded_dirs)
-        if module_name is not None:
-            valid_modules.add(module_name)
-
-    for file in files:
-        file_path = str(file)
-        source_module = module_name_from_file_path(file_path, code_root_folder, strict=False, excluded_dirs=excluded_dirs)
-        if source_module is None:
-            continue
-
-        G.add_node(source_module)
-
-        for target_module in imports_from_file(file_path, code_root_folder, excluded_dirs=excluded_dirs):
-            target_base = target_module.split('.')[0]
-            if any(target_module.startswith(vm) or target_base == vm.split('.')[0] for vm in valid_modules):
-                G.add_edge(source_module, target_module)
-
-    isolated = list(nx.isolates(G))
-    G.remove_nodes_from(isolated)
 
+def graph_centrality(G: nx.DiGraph | CompactGraph, top_n, engine: CentralityEngine | None = None, draw: bool = False, layout_cache: LayoutCache | None = None, renderer=None, betweenness=None) -> tuple[dict, dict, dict]:
+    """Compute the degree and betweenness centrality of an already built graph, drawing them when `draw` is set or queueing them on a FigureRenderer.
+
+    An already computed `betweenness` is reused instead of running `engine`.
+    A CompactGraph only becomes a networkx graph if it is drawn here.
+    """
+    engine = engine or CentralityEngine()
     in_degree = dict(G.in_degree())
     out_degree = dict(G.out_degree())
-    betweenness = nx.betweenness_centrality(G)
+    if betweenness is None:
+        betweenness = engine.betweenness(G)
 
     in_degree_nonzero = {k: v for k, v in in_degree.items() if v > 0}
     out_degree_nonzero = {k: v for k, v in out_degree.items() if v > 0}
     betweenness_nonzero = {k: v for k, v in betweenness.items() if v > 0}
 
-    draw_graph_centrality(G, out_degree_nonzero, in_degree_nonzero, betweenness_nonzero, top_n)
-    draw_graph_centrality_barplot(out_degree_nonzero, in_degree_nonzero, betweenness_nonzero, top_n)
+    if renderer is not None:
+        renderer.submit("dependency_graph_emphasized", G, out_degree_nonzero, in_degree_nonzero, betweenness_nonzero, top_n, scores=betweenness)
+        renderer.submit("dependency_graph_centrality", out_degree_nonzero, in_degree_nonzero, betweenness_nonzero, top_n)
+    elif draw:
+        draw_graph_centrality(G.to_networkx() if isinstance(G, CompactGraph) else G, out_degree_nonzero, in_degree_nonzero, betweenness_nonzero, top_n, layout_cache=layout_cache)
+        draw_graph_centrality_barplot(out_degree_nonzero, in_degree_nonzero, betweenness_nonzero, top_n)
+
+    return in_degree_nonzero, out_degree_nonzero, betweenness_nonzero
 
+def dependencies_digraph_centrality(code_root_folder: str, top_n, cache_path: str | None = None, jobs: int | None = 1, engine: CentralityEngine | None = None) -> nx.DiGraph:
+    G = build_dependency_graph(code_root_folder, cache_path=cache_path, jobs=jobs)
+    graph_centrality(G, top_n, engine=engine, draw=True)
     return G
 
-def draw_graph(G):
-    """Draw and save a graph visualization using matplotlib."""
+def _induced_subgraph(G, nodes):
+    """Copy of the subgraph on `nodes`, in G's node order (a subgraph view iterates in set order, which varies between runs)."""
+    H = G.__class__()
+    H.add_nodes_from(node for node in G if node in nodes)
+    H.add_edges_from((u, v) for u, v in G.edges() if u in nodes and v in nodes)
+    return H
+
+@instrumentation.timed("rendering")
+def draw_graph(G, layout_cache: LayoutCache | None = None, labels=None, output_file="./img/dependency_graph.png", dpi=None, formats=None):
+    """Draw and save a graph visualization using matplotlib; with `labels`, only those nodes are labelled."""
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(40,40))
-    pos = nx.spring_layout(G)
-    nx.draw(G, pos, with_labels=True, node_size=500, font_size=8)
-    plt.savefig("./img/dependency_graph.png")
-    plt.close()
+    pos = graph_layout(G, "dependency_graph", cache=layout_cache)
+    nx.draw(G, pos, with_labels=True, labels=labels, node_size=500, font_size=8)
+    return save_figure(output_file, dpi, formats)
 
-def draw_graph_centrality_barplot(out_degree, in_degree, betweenness, top_n=20):
+@instrumentation.timed("rendering")
+def draw_graph_centrality_barplot(out_degree, in_degree, betweenness, top_n=20, output_file="./img/dependency_graph_centrality.png", dpi=300, formats=None):
     """Draw and save a bar plot visualization of centrality metrics using matplotlib."""
-    in_degree_top = dict(sorted(in_degree.items(), key=lambda x: x[1], reverse=True)[:top_n])
-    out_degree_top = dict(sorted(out_degree.items(), key=lambda x: x[1], reverse=True)[:top_n])
-    betweenness_top = dict(sorted(betweenness.items(), key=lambda x: x[1], reverse=True)[:top_n])
+    import matplotlib.pyplot as plt
+    in_degree_top = dict(top_n_items(in_degree, top_n))
+    out_degree_top = dict(top_n_items(out_degree, top_n))
+    betweenness_top = dict(top_n_items(betweenness, top_n))
     
     plt.figure(figsize=(15, 15))
     
@@ -110,17 +205,18 @@ def draw_graph_centrality_barplot(out_degree, in_degree, betweenness, top_n=20):
     plt.title("Betweenness Centrality (Modules as Bridges)")
     
     plt.tight_layout(pad=3.0) 
-    plt.savefig("./img/dependency_graph_centrality.png", dpi=300, bbox_inches='tight') 
-    plt.close()
+    return save_figure(output_file, dpi, formats, bbox_inches='tight')
 
-def draw_graph_centrality(G,out_degree, in_degree, betweenness, top_n=20):
+@instrumentation.timed("rendering")
+def draw_graph_centrality(G,out_degree, in_degree, betweenness, top_n=20, layout_cache: LayoutCache | None = None, labels=None, output_file="./img/dependency_graph_emphasized.png", dpi=None, formats=None):
     """Draw and save a graph visualization using NetworkX with centrality-based styling."""
+    import matplotlib.pyplot as plt
 
-    top_nodes = sorted(in_degree.items(), key=lambda x: x[1], reverse=True)[:top_n]
-    G = G.subgraph([node for node, _ in top_nodes])
+    top_nodes = {node for node, _ in top_n_items(in_degree, top_n)}
+    G = _induced_subgraph(G, top_nodes)
 
     plt.figure(figsize=(40, 40))
-    pos = nx.spring_layout(G)
+    pos = graph_layout(G, "dependency_graph_emphasized", cache=layout_cache)
     
     node_sizes = [in_degree.get(node, 0) * 500 for node in G.nodes()]
     
@@ -130,6 +226,7 @@ def draw_graph_centrality(G,out_degree, in_degree, betweenness, top_n=20):
     nx.draw(
         G, pos,
         with_labels=True,
+        labels={node: label for node, label in labels.items() if node in G} if labels is not None else None,
         node_size=node_sizes,
         node_color=node_colors,
         cmap=plt.cm.Blues, 
@@ -139,5 +236,4 @@ def draw_graph_centrality(G,out_degree, in_degree, betweenness, top_n=20):
         alpha=0.7
     )
     
-    plt.savefig("./img/dependency_graph_emphasized.png")
-    plt.close()
\ No newline at end of file
+    return save_figure(output_file, dpi, formats)
\ No newline at end of file
@@ -0,0 +1,178 @@
+import logging
+import random
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Graphs with more nodes than this are laid out with the multilevel algorithm.
+MULTILEVEL_THRESHOLD = 500
+
+# Coarsening stops once a level has at most this many nodes.
+COARSEST_SIZE = 64
+
+# Strength of the pull towards the center, relative to an edge's attraction.
+GRAVITY = 0.05
+
+
+def _symmetric_adjacency(G, nodes):
+    """Undirected, weighted CSR adjacency of `G` over `nodes`, without self-loops."""
+    codes = {node: i for i, node in enumerate(nodes)}
+    edges = [(codes[u], codes[v]) for u, v in G.edges() if u != v]
+    rows = np.fromiter((u for u, _ in edges), dtype=np.int64, count=len(edges))
+    cols = np.fromiter((v for _, v in edges), dtype=np.int64, count=len(edges))
+    A = sp.csr_matrix((np.ones(len(edges)), (rows, cols)), shape=(len(nodes), len(nodes)))
+    return (A + A.T).tocsr()
+
+def _heavy_edge_matching(A, rng) -> np.ndarray:
+    """Parent code of every node after pairing each node with its heaviest unmatched neighbour."""
+    n = A.shape[0]
+    parent = np.full(n, -1, dtype=np.int64)
+    order = list(range(n))
+    rng.shuffle(order)
+    coarse = 0
+    for u in order:
+        if parent[u] >= 0:
+            continue
+        start, end = A.indptr[u], A.indptr[u + 1]
+        best, best_weight = -1, 0.0
+        for v, w in zip(A.indices[start:end], A.data[start:end]):
+            if parent[v] < 0 and v != u and w > best_weight:
+                best, best_weight = v, w
+        parent[u] = coarse
+        if best >= 0:
+            parent[best] = coarse
+        coarse += 1
+    return parent
+
+def _mesh_repulsion(pos, k, mesh):
+    """Fruchterman-Reingold repulsion k^2/d on every node, summed with a particle-mesh approximation.
+
+    Nodes are binned onto a `mesh` x `mesh` grid over the bulk of the layout
+    and the far field is one FFT convolution of the cell masses with the force
+    kernel. Pairs in neighbouring cells are summed exactly (found with a k-d
+    tree), so a call costs O(n + mesh^2 log mesh) plus the close pairs.
+    """
+    n = len(pos)
+    low, high = np.percentile(pos, [1, 99], axis=0)
+    h = max(float((high - low).max()) / (mesh - 1), 1e-9)
+    cells = np.clip(np.floor((pos - low) / h).astype(np.int64), 0, mesh - 1)
+    mass = np.bincount(cells[:, 0] * mesh + cells[:, 1], minlength=mesh * mesh).reshape(mesh, mesh).astype(float)
+
+    offsets = np.arange(-mesh + 1, mesh)
+    dx, dy = np.meshgrid(offsets, offsets, indexing='ij')
+    r2 = (dx * dx + dy * dy) * h * h
+    near = (np.abs(dx) <= 1) & (np.abs(dy) <= 1)
+    scale = np.where(near, 0.0, k * k / np.where(near, 1.0, r2))
+    size = 2 * mesh - 1
+    shape = (size + mesh - 1, size + mesh - 1)
+    mass_hat = np.fft.rfft2(mass, shape)
+    force = np.empty((n, 2))
+    for axis, kernel in enumerate((dx * h * scale, dy * h * scale)):
+        field = np.fft.irfft2(mass_hat * np.fft.rfft2(kernel, shape), shape)[mesh - 1:2 * mesh - 1, mesh - 1:2 * mesh - 1]
+        force[:, axis] = field[cells[:, 0], cells[:, 1]]
+
+    pairs = cKDTree(pos).query_pairs(1.5 * h, output_type='ndarray')
+    i, j = pairs[:, 0], pairs[:, 1]
+    delta = pos[i] - pos[j]
+    distance = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 0.01 * k)
+    repulsion = delta * (k * k / distance ** 2)[:, None]
+    for axis in range(2):
+        force[:, axis] += np.bincount(i, repulsion[:, axis], minlength=n) - np.bincount(j, repulsion[:, axis], minlength=n)
+    return force
+
+def _force_directed(A, pos, k, iterations, temperature, fixed=None, mesh=64):
+    """Fruchterman-Reingold on a sparse adjacency with mesh-approximated repulsion, O(n + E) per iteration.
+
+    `fixed` is a boolean mask of nodes that must not move.
+    """
+    n = len(pos)
+    coo = sp.triu(A, k=1).tocoo()
+    rows, cols = coo.row, coo.col
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        displacement = _mesh_repulsion(pos, k, mesh)
+        delta = pos[rows] - pos[cols]
+        distance = np.hypot(delta[:, 0], delta[:, 1])
+        attraction = delta * (distance / k)[:, None]
+        for axis in range(2):
+            displacement[:, axis] += np.bincount(cols, attraction[:, axis], minlength=n) - np.bincount(rows, attraction[:, axis], minlength=n)
+        # A weak pull towards the center keeps disconnected parts from drifting away.
+        offset = pos - np.median(pos, axis=0)
+        displacement -= GRAVITY * offset * (np.hypot(offset[:, 0], offset[:, 1]) / k)[:, None]
+        if fixed is not None:
+            displacement[fixed] = 0.0
+        length = np.maximum(np.hypot(displacement[:, 0], displacement[:, 1]), 1e-12)
+        pos = pos + displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+    return pos
+
+def _normalized(pos):
+    """`pos` centered on its median, with the bulk (10th-90th percentile) of the nodes spanning [-1, 1].
+
+    Stragglers, typically nodes of small disconnected components, are pulled in to [-2, 2].
+    """
+    low, high = np.percentile(pos, [10, 90], axis=0)
+    return np.clip((pos - np.median(pos, axis=0)) / max(float((high - low).max()) / 2, 1e-12), -2.0, 2.0)
+
+def multilevel_layout(G, seed: int | None = 0, iterations: int = 50, initial=None, fixed=None) -> dict:
+    """Force-directed layout for large graphs, scaled to [-1, 1] like `nx.spring_layout`.
+
+    The graph is coarsened by repeated heavy-edge matching until at most
+    `COARSEST_SIZE` nodes remain. That level is laid out with
+    `nx.spring_layout`; every finer level starts from its parents' positions
+    and is refined with mesh-approximated repulsion. With `initial` positions
+    (and the `fixed` nodes among them) coarsening is skipped and only the
+    finest level is refined.
+    """
+    nodes = list(G)
+    n = len(nodes)
+    if n == 0:
+        return {}
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    A = _symmetric_adjacency(G, nodes)
+
+    if initial is not None:
+        pos = np.array([initial.get(node, (0.0, 0.0)) for node in nodes], dtype=float)
+        fixed = set(fixed or ())
+        fixed_mask = np.array([node in fixed for node in nodes]) if fixed else None
+        low, high = np.percentile(pos, [10, 90], axis=0)
+        k = float((high - low).max()) / np.sqrt(n)
+        pos = _force_directed(A, pos, k, iterations, k, fixed=fixed_mask)
+        return dict(zip(nodes, pos))
+
+    levels = []
+    while A.shape[0] > COARSEST_SIZE:
+        parent = _heavy_edge_matching(A, rng)
+        size = parent.max() + 1
+        if size > 0.9 * A.shape[0]:
+            break
+        P = sp.csr_matrix((np.ones(len(parent)), (np.arange(len(parent)), parent)), shape=(len(parent), size))
+        levels.append((A, parent))
+        A = (P.T @ A @ P).tocsr()
+        A.setdiag(0)
+        A.eliminate_zeros()
+
+    # Merged edges only decide the matching; the forces treat every edge alike.
+    coarsest = nx.spring_layout(nx.from_scipy_sparse_array(A), weight=None, iterations=iterations, seed=seed)
+    pos = np.array([coarsest[i] for i in range(A.shape[0])])
+    for A, parent in reversed(levels):
+        k = 2.0 / np.sqrt(len(parent))
+        pos = _normalized(pos)[parent] + np_rng.uniform(-k, k, (len(parent), 2)) * 0.5
+        pos = _force_directed(A, pos, k, max(iterations // 3, 10), 4 * k)
+
+    logger.debug(f"Multilevel layout of {n} nodes over {len(levels) + 1} levels.")
+    return dict(zip(nodes, nx.rescale_layout(_normalized(pos))))
+
+@instrumentation.timed("layout")
+def compute_layout(G, seed: int | None = 0, iterations: int = 50, k=None, initial=None, fixed=None, multilevel_threshold: int = MULTILEVEL_THRESHOLD) -> dict:
+    """Node positions for drawing `G`: seeded `nx.spring_layout`, or `multilevel_layout` above the threshold."""
+    if len(G) > multilevel_threshold:
+        return multilevel_layout(G, seed=seed, iterations=iterations, initial=initial, fixed=fixed)
+    return nx.spring_layout(G, k=k, pos=initial, fixed=fixed or None, iterations=iterations, seed=seed)
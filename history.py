@@ -0,0 +1,193 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+
+import instrumentation
+from centrality import CENTRALITY_MODES, CentralityEngine, top_n_items
+from exports import write_jsonl
+from file_utils import EXCLUDED_DIRS, ProjectIndex
+from graph_builder import compact_graph_from_imports
+from import_cache import DEFAULT_CACHE_PATH, ImportCache
+from import_parser import SCANNERS, extract_imports, resolve_imports
+from module_trie import MATCH_POLICIES, ModuleTrie
+
+logger = logging.getLogger(__name__)
+
+
+def _git(code_root_folder, *args) -> str:
+    result = subprocess.run(['git', *args], cwd=code_root_folder, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"Error running git {args[0]}: {result.stderr.strip()}")
+    return result.stdout
+
+
+class GitObjectReader:
+    """Reads blobs through one long-lived `git cat-file --batch` process instead of a process per object."""
+
+    def __init__(self, code_root_folder):
+        self.process = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=code_root_folder,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def read(self, sha: str) -> bytes:
+        self.process.stdin.write(sha.encode('ascii') + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            raise KeyError(f"Git object {sha} is missing.")
+        data = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)
+        return data
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def tree_blobs(code_root_folder, commit: str) -> dict:
+    """`{path: blob sha}` of every file below the code root in `commit`, relative to the code root, from `git ls-tree -r`."""
+    blobs = {}
+    # Without --full-tree, ls-tree lists only the code root's subtree, relative to it.
+    for entry in _git(code_root_folder, 'ls-tree', '-r', '-z', commit).split('\0'):
+        meta, _, path = entry.partition('\t')
+        parts = meta.split()
+        if len(parts) == 3 and parts[1] == 'blob':
+            blobs[path] = parts[2]
+    return blobs
+
+def sample_commits(code_root_folder, n: int, rev: str = "HEAD") -> list[tuple[str, int]]:
+    """`n` first-parent commits of `rev`, evenly spaced from the oldest to the newest, as `(sha, timestamp)` oldest first."""
+    commits = [line.split() for line in _git(code_root_folder, 'log', '--first-parent', '--format=%H %ct', rev).splitlines() if line]
+    commits.reverse()
+    if len(commits) > n:
+        commits = [commits[i] for i in sorted({round(k * (len(commits) - 1) / max(n - 1, 1)) for k in range(n)})]
+    return [(sha, int(ts)) for sha, ts in commits]
+
+def _cycle_stats(graph) -> tuple[int, int]:
+    """Number of import cycles (strongly connected components of more than one module) and modules inside them."""
+    if not len(graph):
+        return 0, 0
+    _, components = connected_components(graph.adjacency(), directed=True, connection='strong')
+    sizes = np.bincount(components)
+    return int((sizes > 1).sum()), int(sizes[sizes > 1].sum())
+
+
+class HistoryAnalyzer:
+    """Import graphs of past commits, built from git objects without checking anything out.
+
+    Each sampled commit's tree is listed with `git ls-tree`, indexed with
+    `ProjectIndex.from_paths`, and its module blobs are read through one
+    `git cat-file --batch` process. Imports are extracted once per blob (and
+    module name): most blobs are shared between revisions, so later commits
+    mostly reuse earlier results, and with `cache` they are kept between runs.
+    """
+
+    def __init__(self, code_root_folder, excluded_dirs=EXCLUDED_DIRS, match_policy: str = "package", scanner: str = "ast", cache: ImportCache | None = None, centrality_engine: CentralityEngine | None = None, top_n: int = 5):
+        self.code_root_folder = code_root_folder
+        self.excluded_dirs = excluded_dirs
+        self.match_policy = match_policy
+        self.scanner = scanner
+        self.cache = cache
+        self.centrality_engine = centrality_engine or CentralityEngine()
+        self.top_n = top_n
+        self._blob_imports = {}
+
+    def _imports(self, reader, blob, path, source_module):
+        key = (blob, source_module)
+        imports = self._blob_imports.get(key)
+        if imports is None and self.cache is not None:
+            imports = self.cache.lookup_blob(blob, source_module, self.scanner)
+        if imports is None:
+            imports = sorted(extract_imports(reader.read(blob), source_module, filename=path, scanner=self.scanner))
+            instrumentation.count("blobs_parsed")
+            if self.cache is not None:
+                self.cache.store_blob(blob, source_module, imports, self.scanner)
+        self._blob_imports[key] = imports
+        return imports
+
+    def graph_at(self, reader, commit: str):
+        """CompactGraph of the modules in `commit`."""
+        blobs = tree_blobs(self.code_root_folder, commit)
+        index = ProjectIndex.from_paths(self.code_root_folder, blobs, self.excluded_dirs)
+        modules = list(index.modules())
+        all_targets = [
+            resolve_imports(self._imports(reader, blobs[relative_path.replace(os.sep, '/')], relative_path, module), index)
+            for relative_path, module in index.path_to_module.items()
+        ]
+        return compact_graph_from_imports(modules, all_targets, ModuleTrie(index.path_to_module.values()), self.match_policy)
+
+    def metrics(self, commits):
+        """Yield one record of graph metrics per `(sha, timestamp)` commit.
+
+        Each commit is timed as a "history" stage; the time the consumer
+        spends between records is not.
+        """
+        with GitObjectReader(self.code_root_folder) as reader:
+            for sha, timestamp in commits:
+                with instrumentation.stage("history"):
+                    parsed_before = len(self._blob_imports)
+                    graph = self.graph_at(reader, sha)
+                    cycles, modules_in_cycles = _cycle_stats(graph)
+                    betweenness = self.centrality_engine.betweenness(graph)
+                    record = {
+                        "commit": sha,
+                        "date": datetime.fromtimestamp(timestamp, timezone.utc).isoformat(),
+                        "nodes": len(graph),
+                        "edges": graph.number_of_edges(),
+                        "cycles": cycles,
+                        "modules_in_cycles": modules_in_cycles,
+                        "top_betweenness": [module for module, score in top_n_items(betweenness, self.top_n) if score > 0],
+                        "top_in_degree": [module for module, degree in top_n_items(graph.in_degree(), self.top_n) if degree > 0],
+                    }
+                logger.info(f"{sha[:12]} {record['date'][:10]}: {record['nodes']} nodes, {record['edges']} edges, {cycles} cycles ({len(self._blob_imports) - parsed_before} new blobs).")
+                yield record
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time series of dependency-graph metrics over a repository's history, read from git objects.")
+    parser.add_argument("code_root", help="Root of the git repository.")
+    parser.add_argument("--commits", type=int, default=20, help="Number of first-parent commits sampled evenly from the history.")
+    parser.add_argument("--rev", default="HEAD", help="Revision whose history is sampled.")
+    parser.add_argument("--output", default="history.jsonl", help="JSON lines file receiving one metrics record per commit.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite file caching the imports of each blob between runs.")
+    parser.add_argument("--no-cache", action="store_true", help="Keep blob imports in memory only.")
+    parser.add_argument("--match-policy", choices=MATCH_POLICIES, default="package", help="How import targets are matched against the project's modules.")
+    parser.add_argument("--scanner", choices=SCANNERS, default="ast", help="Import extraction: full AST, lexical scan of import statements, or lexical without function bodies.")
+    parser.add_argument("--top", type=int, default=5, help="Number of most central modules listed per commit.")
+    parser.add_argument("--centrality", choices=CENTRALITY_MODES, default="sampled", help="Betweenness algorithm: exact, sampled pivots, or exact split across processes.")
+    parser.add_argument("--centrality-k", type=int, default=256, help="Number of pivot sources in sampled mode.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    commits = sample_commits(args.code_root, args.commits, args.rev)
+    cache = None if args.no_cache else ImportCache(args.cache)
+    try:
+        analyzer = HistoryAnalyzer(args.code_root, match_policy=args.match_policy, scanner=args.scanner, cache=cache, centrality_engine=CentralityEngine(args.centrality, k=args.centrality_k), top_n=args.top)
+        count = write_jsonl(analyzer.metrics(commits), args.output)
+    finally:
+        if cache is not None:
+            cache.report()
+            cache.close()
+    print(f"Metrics of {count} commits written to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
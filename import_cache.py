@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "./img/import_cache.sqlite"
+
+# Bump whenever the extraction logic changes so stale rows are discarded.
+SCHEMA_VERSION = 2
+
+
+class ImportCache:
+    """On-disk cache of the imports extracted from each source file.
+
+    Rows are keyed by file path and validated by size and mtime first; when
+    those differ the file content is hashed, so a touched-but-unchanged file
+    is still a hit. Only the unresolved import names are stored: resolving
+    them depends on which other files exist and is redone on every run.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.hits = 0
+        self.misses = 0
+        self._init_schema()
+
+    def _init_schema(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS imports")
+            self.conn.execute("DROP TABLE IF EXISTS blob_imports")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS imports (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                source_module TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                imports TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blob_imports (
+                blob TEXT NOT NULL,
+                source_module TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                imports TEXT NOT NULL,
+                PRIMARY KEY (blob, source_module, variant)
+            )
+            """
+        )
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def lookup(self, path: str, source_module: str, variant: str = "ast") -> list[str] | None:
+        """Return the cached imports of `path`, or None when the file is new or changed.
+
+        `variant` names the extraction method; rows written by another one are misses.
+        """
+        key = os.path.abspath(path)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, digest, source_module, imports, variant FROM imports WHERE path = ?",
+            (key,),
+        ).fetchone()
+        if row is None or row[3] != source_module or row[5] != variant:
+            self.misses += 1
+            return None
+
+        st = os.stat(key)
+        if row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            self.hits += 1
+            return json.loads(row[4])
+
+        with open(key, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if row[2] != digest:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE imports SET size = ?, mtime_ns = ? WHERE path = ?",
+            (st.st_size, st.st_mtime_ns, key),
+        )
+        return json.loads(row[4])
+
+    def store(self, path: str, source_module: str, imports: Iterable[str], size: int, mtime_ns: int, digest: str, variant: str = "ast"):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO imports (path, size, mtime_ns, digest, source_module, variant, imports) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(path), size, mtime_ns, digest, source_module, variant, json.dumps(sorted(imports))),
+        )
+
+    def lookup_blob(self, blob: str, source_module: str, variant: str = "ast") -> list[str] | None:
+        """Return the cached imports of a git blob (by object id) read as `source_module`, or None."""
+        row = self.conn.execute(
+            "SELECT imports FROM blob_imports WHERE blob = ? AND source_module = ? AND variant = ?",
+            (blob, source_module, variant),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def store_blob(self, blob: str, source_module: str, imports: Iterable[str], variant: str = "ast"):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO blob_imports (blob, source_module, variant, imports) VALUES (?, ?, ?, ?)",
+            (blob, source_module, variant, json.dumps(sorted(imports))),
+        )
+
+    def cached_imports(self, path: str, source_module: str, extract: Callable[[bytes], Iterable[str]], variant: str = "ast") -> list[str]:
+        """Return the imports of `path`, calling `extract` on its bytes only when the file changed."""
+        imports = self.lookup(path, source_module, variant)
+        if imports is not None:
+            return imports
+
+        st = os.stat(path)
+        with open(path, 'rb') as f:
+            source = f.read()
+        imports = sorted(extract(source))
+        self.store(path, source_module, imports, st.st_size, st.st_mtime_ns, hashlib.sha256(source).hexdigest(), variant)
+        return imports
+
+    def clear(self):
+        """Drop every cached entry, including any graph state stored in the same file."""
+        tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table in tables:
+            self.conn.execute(f"DELETE FROM {table}")
+        self.conn.commit()
+        logger.info(f"Import cache '{self.db_path}' invalidated.")
+
+    def report(self):
+        logger.info(f"Import cache: {self.hits} hits, {self.misses} misses ({self.db_path}).")
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,6 +1,10 @@
 import ast
+import hashlib
+import os
 import re
-from file_utils import module_name_from_file_path
+import instrumentation
+from file_utils import project_index
+from import_scanner import scan_import_statements
 from pathlib import Path
 
 
@@ -13,20 +17,50 @@ def import_from_line(line):
         return y.group(1)
     except:
         return None
-    
-def imports_from_file(file: str, code_root_folder: str, excluded_dirs: set[str] | None = None) -> list[str]:
 
+SCANNERS = ("ast", "lexical", "lexical-module")
+
+
+def _add_from_import(all_imports: set[str], source_module: str, level: int, module: str | None, names):
+    if module:
+        all_imports.add(module)
+    elif level > 0:
+        parts = source_module.split('.')
+        if level <= len(parts):
+            base_module = '.'.join(parts[:-level] or [''])
+            for name in names:
+                if name:
+                    full_module = f"{base_module}.{name}" if base_module else name
+                    all_imports.add(full_module)
+
+def scan_imports(source: bytes, source_module: str, include_functions: bool = True) -> set[str]:
+    """Collect the imported names with the lexical scanner, resolving relative imports like the AST path."""
     all_imports = set()
-    file_path = Path(file)
-    source_module = module_name_from_file_path(str(file_path), code_root_folder, strict=False, excluded_dirs=excluded_dirs)
+    for statement in scan_import_statements(source, include_functions=include_functions):
+        if statement[0] == "import":
+            all_imports.update(name for name in statement[1] if name)
+        else:
+            _, level, module, names = statement
+            _add_from_import(all_imports, source_module, level, module, names)
+    return all_imports
 
-    if source_module is None:
-        return []
+def extract_imports(source: bytes, source_module: str, filename: str = "<unknown>", scanner: str = "ast") -> set[str]:
+    """Collect the (unresolved) names imported by a source file.
+
+    `scanner` picks the extraction method: "ast" parses the whole file (falling
+    back to a per-line regex on syntax errors), "lexical" scans only the import
+    statements, and "lexical-module" additionally skips imports inside functions.
+    """
+    if scanner == "lexical":
+        return scan_imports(source, source_module)
+    if scanner == "lexical-module":
+        return scan_imports(source, source_module, include_functions=False)
+    if scanner != "ast":
+        raise ValueError(f"Unknown scanner '{scanner}', expected one of {SCANNERS}.")
 
+    all_imports = set()
     try:
-        with open(file, 'r', encoding='utf-8') as f:
-            source = f.read()
-        tree = ast.parse(source, filename=file)
+        tree = ast.parse(source, filename=filename)
 
         for node in ast.walk(tree):
             if isinstance(node, ast.Import):
@@ -34,35 +68,52 @@ def imports_from_file(file: str, code_root_folder: str, excluded_dirs: set[str]
                     if alias.name:
                         all_imports.add(alias.name)
             elif isinstance(node, ast.ImportFrom):
-                if node.module:
-                    module_name = node.module
-                    all_imports.add(module_name)
-                elif node.level > 0:
-                    parts = source_module.split('.')
-                    level = node.level
-                    if level <= len(parts):
-                        base_module = '.'.join(parts[:-level] or [''])
-                        if node.module:
-                            relative_module = node.module
-                            full_module = f"{base_module}.{relative_module}" if base_module else relative_module
-                        else:
-                            for name in node.names:
-                                if name.name:
-                                    full_module = f"{base_module}.{name.name}" if base_module else name.name
-                                    all_imports.add(full_module)
-
-    except (SyntaxError, UnicodeDecodeError) as e:
-        with open(file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        for line in lines:
+                _add_from_import(all_imports, source_module, node.level, node.module, [name.name for name in node.names])
+
+    except (SyntaxError, ValueError, UnicodeDecodeError):
+        instrumentation.count("regex_fallbacks")
+        for line in source.decode('utf-8', errors='replace').splitlines():
             imp = import_from_line(line)
             if imp:
                 all_imports.add(imp)
 
+    return all_imports
+
+def parse_file(file: str, source_module: str, scanner: str = "ast") -> tuple[list[str], int, int, str]:
+    """Read a file once; return its sorted imports plus the size, mtime and digest the cache keys on."""
+    st = os.stat(file)
+    with open(file, 'rb') as f:
+        source = f.read()
+    imports = sorted(extract_imports(source, source_module, filename=file, scanner=scanner))
+    return imports, st.st_size, st.st_mtime_ns, hashlib.sha256(source).hexdigest()
+
+def resolve_imports(imports, index) -> list[str]:
+    """Keep only the imported names that map to a module file of the project index."""
     valid_imports = []
-    for imp in all_imports:
-        possible_path = f"{code_root_folder}/{imp.replace('.', '/')}.py"
-        module_name = module_name_from_file_path(possible_path, code_root_folder, strict=False, excluded_dirs=excluded_dirs)
+    instrumentation.count("resolution_calls", len(imports))
+    for imp in imports:
+        module_name = index.module_for_import(imp)
         if module_name:
             valid_imports.append(module_name)
-    return valid_imports
\ No newline at end of file
+    return valid_imports
+
+def imports_from_file(file: str, code_root_folder: str, excluded_dirs: set[str] | None = None, cache=None, index=None, scanner: str = "ast") -> list[str]:
+
+    if index is None:
+        index = project_index(code_root_folder, excluded_dirs)
+    file_path = Path(file)
+    source_module = index.module_name(str(file_path))
+
+    if source_module is None:
+        return []
+
+    def extract(source: bytes) -> set[str]:
+        return extract_imports(source, source_module, filename=file, scanner=scanner)
+
+    if cache is not None:
+        all_imports = cache.cached_imports(file, source_module, extract, variant=scanner)
+    else:
+        with open(file, 'rb') as f:
+            all_imports = extract(f.read())
+
+    return resolve_imports(all_imports, index)
@@ -0,0 +1,129 @@
+import re
+
+# One pass over the raw bytes: string literals and comments are consumed whole
+# so that `import` inside them is never seen; statement starts are either at
+# the beginning of a line or right after `:`/`;` on the same line.
+_LEXER = re.compile(
+    rb"""
+    (?P<string>
+        (?<![\w])[rRbBuUfF]{0,2}
+        (?: '''(?:[^'\\]|\\.|'(?!''))*'''
+          | \"\"\"(?:[^"\\]|\\.|"(?!""))*\"\"\"
+          | '(?:[^'\\\n]|\\.)*'
+          | "(?:[^"\\\n]|\\.)*"
+        )
+    )
+    | (?P<comment>\#[^\n]*)
+    | ^(?P<indent>[ \t]*)(?P<keyword>import|from|async[ \t]+def|def|class|if|elif|else|try|except|finally|with|for|while|async|match|case)\b
+    | (?P<inline>[:;])[ \t]*(?=(?:import|from)\b)
+    """,
+    re.MULTILINE | re.VERBOSE | re.DOTALL,
+)
+
+_STATEMENT_TOKEN = re.compile(rb"\.\.\.|[A-Za-z_\x80-\xff][\w\x80-\xff]*|[.,()*\\]|\#[^\n]*|\n|[^\s]")
+
+
+def _statement_tokens(source: bytes, pos: int) -> tuple[list[bytes], int]:
+    """Tokens of the import statement starting at `pos`, up to its logical end, and the offset of that end."""
+    tokens = []
+    depth = 0
+    for match in _STATEMENT_TOKEN.finditer(source, pos):
+        token = match.group()
+        if token == b"\n":
+            if depth == 0 and not (tokens and tokens[-1] == b"\\"):
+                return tokens, match.start()
+            if tokens and tokens[-1] == b"\\":
+                tokens.pop()
+            continue
+        if token.startswith(b"#"):
+            continue
+        if token == b"(":
+            depth += 1
+        elif token == b")":
+            depth -= 1
+        elif token in (b";", b":") and depth == 0:
+            return tokens, match.start()
+        tokens.append(token)
+    return tokens, len(source)
+
+def _dotted_names(tokens: list[bytes]) -> list[tuple[str, str | None]]:
+    """Split `a.b as c, d` into `[("a.b", "c"), ("d", None)]`."""
+    names = []
+    current = []
+    alias = None
+    expect_alias = False
+    for token in tokens + [b","]:
+        if token in (b"(", b")"):
+            continue
+        if token == b",":
+            if current:
+                names.append(("".join(current), alias))
+            current, alias, expect_alias = [], None, False
+        elif token == b"as":
+            expect_alias = True
+        elif expect_alias:
+            alias = token.decode("utf-8", errors="replace")
+        else:
+            current.append(token.decode("utf-8", errors="replace"))
+    return names
+
+def parse_import_statement(tokens: list[bytes]):
+    """Turn the tokens of one statement into `("import", names)` or `("from", level, module, names)`."""
+    if not tokens:
+        return None
+    if tokens[0] == b"import":
+        return "import", [name for name, _ in _dotted_names(tokens[1:])]
+    if tokens[0] != b"from" or b"import" not in tokens:
+        return None
+
+    split = tokens.index(b"import")
+    level = 0
+    module_parts = []
+    for token in tokens[1:split]:
+        if token == b"...":
+            level += 3
+        elif token == b"." and not module_parts:
+            level += 1
+        else:
+            module_parts.append(token.decode("utf-8", errors="replace"))
+    module = "".join(module_parts) or None
+    return "from", level, module, [name for name, _ in _dotted_names(tokens[split + 1:])]
+
+def scan_import_statements(source: bytes, include_functions: bool = True):
+    """Yield the parsed import statements of a module without building an AST.
+
+    Module-level imports, including those inside conditional blocks such as
+    `if TYPE_CHECKING:` or `try:`, are always reported; imports inside function
+    bodies only when `include_functions` is true.
+    """
+    # Indent widths of the function definitions enclosing the current line.
+    functions = []
+    pos = 0
+    while (match := _LEXER.search(source, pos)) is not None:
+        pos = match.end()
+        kind = match.lastgroup
+        if kind in ("string", "comment"):
+            continue
+
+        if kind == "inline":
+            start = match.end()
+        else:
+            # Any compound-statement keyword at the start of a line closes the
+            # blocks indented at least as deep as it is.
+            indent = len(match.group("indent").expandtabs(8))
+            while functions and functions[-1] >= indent:
+                functions.pop()
+            keyword = match.group("keyword")
+            if keyword.endswith(b"def"):
+                functions.append(indent)
+            if keyword not in (b"import", b"from"):
+                continue
+            start = match.start("keyword")
+
+        # Resume after the statement, so its continuation lines are not taken for statements of their own.
+        tokens, pos = _statement_tokens(source, start)
+        if functions and not include_functions:
+            continue
+        statement = parse_import_statement(tokens)
+        if statement is not None:
+            yield statement
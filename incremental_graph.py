@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import subprocess
+from collections import Counter
+
+import networkx as nx
+
+import instrumentation
+
+from file_utils import EXCLUDED_DIRS, refresh_project_index
+from graph_builder import collect_imports
+from import_cache import DEFAULT_CACHE_PATH, ImportCache
+from module_trie import ModuleTrie
+
+logger = logging.getLogger(__name__)
+
+CHANGE_DETECTION_MODES = ("mtime", "git")
+
+
+class GraphDelta:
+    """Nodes and edges added to or removed from the dependency graph by one update."""
+
+    def __init__(self):
+        self.added_nodes = set()
+        self.removed_nodes = set()
+        self.added_edges = set()
+        self.removed_edges = set()
+        self.changed_files = set()
+
+    def __bool__(self):
+        return bool(self.added_nodes or self.removed_nodes or self.added_edges or self.removed_edges)
+
+    def __repr__(self):
+        return (
+            f"GraphDelta(files={len(self.changed_files)}, +nodes={len(self.added_nodes)}, -nodes={len(self.removed_nodes)}, "
+            f"+edges={len(self.added_edges)}, -edges={len(self.removed_edges)})"
+        )
+
+
+def git_changed_paths(code_root_folder, base_sha: str) -> set[str] | None:
+    """Paths (relative to the root) that differ from `base_sha` in the working tree, plus untracked files."""
+    # --relative limits the diff to the root's subtree and reports paths from the root, like ls-files does.
+    diff = subprocess.run(['git', 'diff', '--name-only', '--relative', '-z', base_sha], cwd=code_root_folder, capture_output=True)
+    untracked = subprocess.run(['git', 'ls-files', '--others', '--exclude-standard', '-z'], cwd=code_root_folder, capture_output=True)
+    if diff.returncode != 0 or untracked.returncode != 0:
+        return None
+    names = (diff.stdout + untracked.stdout).decode('utf-8', errors='replace').split('\0')
+    return {os.path.normpath(name) for name in names if name}
+
+def _git_head(code_root_folder) -> str | None:
+    result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=code_root_folder, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+class IncrementalGraph:
+    """File-level dependency graph persisted next to the import cache and updated in place.
+
+    The out-edges of every module file are stored per file path. `update`
+    re-walks the tree, finds files that were added, modified or deleted (by
+    size/mtime, or with `git diff --name-only` against the commit of the last
+    update plus the files that were dirty then) and recomputes only their out-edges, plus those of unchanged files
+    that import a module which appeared or disappeared. Adding or removing an
+    `__init__.py` changes module names wholesale and triggers a full rebuild.
+    As in `build_dependency_graph`, nodes without any edge are left out. The
+    store holds one code root and scanner at a time; switching starts it afresh.
+    """
+
+    def __init__(self, code_root_folder: str, cache_path: str = DEFAULT_CACHE_PATH, excluded_dirs=EXCLUDED_DIRS, jobs: int | None = 1, match_policy: str = "package", scanner: str = "ast", discovery: str = "walk"):
+        self.code_root_folder = code_root_folder
+        self.excluded_dirs = excluded_dirs
+        self.discovery = discovery
+        self.jobs = jobs
+        self.match_policy = match_policy
+        self.scanner = scanner
+        self.cache = ImportCache(cache_path)
+        self.conn = self.cache.conn
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS graph_files (
+                path TEXT PRIMARY KEY,
+                module TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                targets TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS graph_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+        self.graph = None
+        self.files = {}
+        self._edge_refs = Counter()
+
+    def load(self) -> nx.DiGraph:
+        """Load the persisted graph without looking at the filesystem."""
+        self.files = {}
+        self._edge_refs = Counter()
+        for path, module, size, mtime_ns, targets in self.conn.execute("SELECT path, module, size, mtime_ns, targets FROM graph_files"):
+            targets = json.loads(targets)
+            self.files[path] = (module, size, mtime_ns, targets)
+            self._edge_refs.update((module, target) for target in targets)
+        self.graph = nx.DiGraph(list(self._edge_refs))
+        return self.graph
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM graph_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _modified(self, current, detection):
+        common = current.keys() & self.files.keys()
+        if detection == "git":
+            base_sha, dirty = self._meta('head'), self._meta('dirty')
+            changed = git_changed_paths(self.code_root_folder, base_sha) if base_sha and dirty is not None else None
+            if changed is not None:
+                # Files dirty at the last update may since have been reverted to `base_sha`.
+                changed |= set(json.loads(dirty))
+                return {path for path in common if path in changed}
+            logger.info("No usable git baseline for the graph store; falling back to mtime change detection.")
+
+        modified = set()
+        for path in common:
+            st = os.stat(os.path.join(self.code_root_folder, path))
+            _, size, mtime_ns, _ = self.files[path]
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                modified.add(path)
+        return modified
+
+    @instrumentation.timed("graph_update")
+    def update(self, detection: str = "mtime") -> GraphDelta:
+        """Bring the graph up to date with the tree and return what changed."""
+        if detection not in CHANGE_DETECTION_MODES:
+            raise ValueError(f"Unknown change detection '{detection}', expected one of {CHANGE_DETECTION_MODES}.")
+        index = refresh_project_index(self.code_root_folder, self.excluded_dirs, self.discovery)
+        if self._meta('root') != str(index.root) or self._meta('scanner') != self.scanner:
+            self.conn.execute("DELETE FROM graph_files")
+            self.conn.execute("DELETE FROM graph_meta")
+            self.conn.execute("INSERT INTO graph_meta (key, value) VALUES ('root', ?)", (str(index.root),))
+            self.conn.execute("INSERT INTO graph_meta (key, value) VALUES ('scanner', ?)", (self.scanner,))
+            self.graph = None
+        if self.graph is None:
+            self.load()
+
+        current = dict(index.path_to_module)
+        added = current.keys() - self.files.keys()
+        deleted = self.files.keys() - current.keys()
+        renamed = {path for path in current.keys() & self.files.keys() if self.files[path][0] != current[path]}
+
+        if not self.files:
+            affected = set(current)
+        elif renamed or any(os.path.basename(path) == "__init__.py" for path in added | deleted):
+            logger.info("Package layout changed; recomputing every file's dependencies.")
+            affected = set(current)
+        else:
+            affected = added | self._modified(current, detection)
+            vanished_or_new = {self.files[path][0] for path in deleted} | {current[path] for path in added}
+            if vanished_or_new:
+                affected |= self._importers_of(vanished_or_new, current.keys() - affected, index.root)
+
+        delta = GraphDelta()
+        delta.changed_files = affected | deleted
+        for path in deleted:
+            module, _, _, targets = self.files.pop(path)
+            self._drop_edges(module, targets, delta)
+            self.conn.execute("DELETE FROM graph_files WHERE path = ?", (path,))
+
+        ordered = sorted(affected)
+        stats = {path: os.stat(os.path.join(self.code_root_folder, path)) for path in ordered}
+        modules = [(str(index.root / path), current[path]) for path in ordered]
+        valid_modules = ModuleTrie(current.values())
+        for path, (_, module), targets in zip(ordered, modules, collect_imports(modules, index, cache=self.cache, jobs=self.jobs, scanner=self.scanner)):
+            targets = sorted({target for target in targets if valid_modules.matches(target, self.match_policy)})
+            if path in self.files:
+                old_module, _, _, old_targets = self.files[path]
+                self._drop_edges(old_module, old_targets, delta)
+            self._add_edges(module, targets, delta)
+            st = stats[path]
+            self.files[path] = (module, st.st_size, st.st_mtime_ns, targets)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO graph_files (path, module, size, mtime_ns, targets) VALUES (?, ?, ?, ?, ?)",
+                (path, module, st.st_size, st.st_mtime_ns, json.dumps(targets)),
+            )
+
+        for u, v in list(delta.removed_edges & delta.added_edges):
+            delta.removed_edges.discard((u, v))
+            delta.added_edges.discard((u, v))
+        for node in list(delta.removed_nodes & delta.added_nodes):
+            delta.removed_nodes.discard(node)
+            delta.added_nodes.discard(node)
+
+        head = _git_head(self.code_root_folder)
+        if head:
+            self.conn.execute("INSERT OR REPLACE INTO graph_meta (key, value) VALUES ('head', ?)", (head,))
+        # The next git-mode update must also re-check the files that differ from `head` now.
+        dirty = git_changed_paths(self.code_root_folder, head) if head and detection == "git" else None
+        if dirty is not None:
+            self.conn.execute("INSERT OR REPLACE INTO graph_meta (key, value) VALUES ('dirty', ?)", (json.dumps(sorted(dirty)),))
+        else:
+            self.conn.execute("DELETE FROM graph_meta WHERE key = 'dirty'")
+        self.conn.commit()
+        if delta:
+            logger.info(f"Dependency graph updated: {delta}")
+        else:
+            logger.debug(f"Dependency graph unchanged: {delta}")
+        return delta
+
+    def _importers_of(self, module_names, candidates, root) -> set[str]:
+        """Files among `candidates` whose cached raw imports mention one of `module_names`."""
+        importers = set()
+        for path in candidates:
+            row = self.conn.execute("SELECT imports FROM imports WHERE path = ? AND variant = ?", (str(root / path), self.scanner)).fetchone()
+            if row is None or module_names.intersection(json.loads(row[0])):
+                importers.add(path)
+        return importers
+
+    def _drop_edges(self, module, targets, delta):
+        for target in targets:
+            edge = (module, target)
+            self._edge_refs[edge] -= 1
+            if self._edge_refs[edge] > 0:
+                continue
+            del self._edge_refs[edge]
+            self.graph.remove_edge(*edge)
+            delta.removed_edges.add(edge)
+            for node in edge:
+                if node in self.graph and self.graph.degree(node) == 0:
+                    self.graph.remove_node(node)
+                    delta.removed_nodes.add(node)
+
+    def _add_edges(self, module, targets, delta):
+        for target in targets:
+            edge = (module, target)
+            self._edge_refs[edge] += 1
+            if self._edge_refs[edge] > 1:
+                continue
+            for node in edge:
+                if node not in self.graph:
+                    delta.added_nodes.add(node)
+            self.graph.add_edge(*edge)
+            delta.added_edges.add(edge)
+
+    def close(self):
+        self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
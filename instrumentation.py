@@ -0,0 +1,166 @@
+import contextlib
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_recorder = None
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def _peak_rss_kb() -> int | None:
+    """Peak resident set size of this process so far, in kB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if os.uname().sysname == "Darwin" else peak
+
+
+class Recorder:
+    """Collects stage timings, counters and memory samples for one run.
+
+    Every `stage` becomes a complete ("X") event of a Chrome trace, carrying
+    the counters incremented while it was the innermost open stage and the
+    process's peak RSS when it ended. With `profile_stage`, that stage runs
+    under cProfile and the stats are written next to the trace. Counters
+    incremented inside worker processes are not collected. A stage opened
+    again while it is already open (a timed function calling another one
+    timed under the same name) is folded into the outer one, so its time is
+    not counted twice. Work done in slices between other stages (such as
+    streamed discovery) is `record`ed afterwards as one event of its summed
+    time, starting where the first slice did.
+    """
+
+    def __init__(self, profile_stage: str | None = None):
+        self.profile_stage = profile_stage
+        self.events = []
+        self.totals = Counter()
+        self.stage_totals = {}
+        self.profiles = {}
+        self._stack = []
+        self._open = Counter()
+        self._origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if self._open[name]:
+            yield
+            return
+        self._open[name] += 1
+        counters = Counter()
+        self._stack.append(counters)
+        profiler = None
+        if name == self.profile_stage:
+            profiler = self.profiles.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if profiler is not None:
+                profiler.disable()
+            self._stack.pop()
+            self._open[name] -= 1
+            self.record(name, start, end - start, counters)
+
+    def record(self, name: str, start: float, seconds: float, counters=None):
+        """Add a completed stage `name` that began at `start` (a `time.perf_counter()` value) and took `seconds`.
+
+        Like a re-entered `stage`, nothing is added while a stage of that name is open.
+        """
+        if self._open[name]:
+            return
+        counters = counters or Counter()
+        peak = _peak_rss_kb()
+        self.events.append({
+            "name": name,
+            "cat": "stage",
+            "ph": "X",
+            "ts": (start - self._origin) * 1e6,
+            "dur": seconds * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {**counters, "peak_rss_kb": peak},
+        })
+        summary = self.stage_totals.setdefault(name, {"calls": 0, "seconds": 0.0, "counters": Counter(), "peak_rss_kb": None})
+        summary["calls"] += 1
+        summary["seconds"] += seconds
+        summary["counters"].update(counters)
+        summary["peak_rss_kb"] = peak
+
+    def count(self, name: str, n: int = 1):
+        self.totals[name] += n
+        if self._stack:
+            self._stack[-1][name] += n
+
+    def summary(self) -> dict:
+        return {
+            "counters": dict(self.totals),
+            "stages": {
+                name: {**stats, "counters": dict(stats["counters"])}
+                for name, stats in self.stage_totals.items()
+            },
+        }
+
+    def write_trace(self, path: str):
+        """Write the events as a Chrome trace (chrome://tracing, Perfetto), with the totals under `otherData`."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms", "otherData": self.summary()}, f, indent=1)
+        for name, profiler in self.profiles.items():
+            profile_path = f"{os.path.splitext(path)[0]}.{name}.prof"
+            profiler.dump_stats(profile_path)
+            logger.info(f"cProfile stats of stage '{name}' written to {profile_path}.")
+        logger.info(f"Trace with {len(self.events)} stage events written to {path}.")
+
+
+def enable(profile_stage: str | None = None) -> Recorder:
+    """Start recording; until then `stage` and `count` do nothing."""
+    global _recorder
+    _recorder = Recorder(profile_stage)
+    return _recorder
+
+def disable() -> Recorder | None:
+    """Stop recording and return what was recorded."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+def stage(name: str):
+    """Context manager timing the enclosed block as stage `name` (a shared no-op while disabled)."""
+    if _recorder is None:
+        return _NULL_STAGE
+    return _recorder.stage(name)
+
+def timed(name: str):
+    """Decorator recording every call of the function as stage `name`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with _recorder.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record(name: str, start: float, seconds: float):
+    """Record stage `name`, timed by the caller, that began at `start` and took `seconds` in total."""
+    if _recorder is not None:
+        _recorder.record(name, start, seconds)
+
+def count(name: str, n: int = 1):
+    """Add `n` to counter `name` for the run and the innermost open stage."""
+    if _recorder is not None:
+        _recorder.count(name, n)
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+
+from graph_layout import compute_layout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAYOUT_CACHE_PATH = "./img/layout_cache.sqlite"
+
+
+def graph_hash(G) -> str:
+    """Digest of the node and edge sets of `G`, independent of insertion order."""
+    digest = hashlib.sha256()
+    for node in sorted(map(str, G)):
+        digest.update(node.encode('utf-8', errors='replace') + b'\0')
+    digest.update(b'\1')
+    for u, v in sorted((str(u), str(v)) for u, v in G.edges()):
+        digest.update(u.encode('utf-8', errors='replace') + b'\0' + v.encode('utf-8', errors='replace') + b'\0')
+    return digest.hexdigest()
+
+def neighborhood_hashes(G) -> dict:
+    """Digest of every node's sorted in- and out-neighbours."""
+    hashes = {}
+    for node in G:
+        if G.is_directed():
+            neighbors = [f">{v}" for v in G.successors(node)] + [f"<{u}" for u in G.predecessors(node)]
+        else:
+            neighbors = [str(v) for v in G.neighbors(node)]
+        hashes[node] = hashlib.sha1("\0".join(sorted(neighbors)).encode('utf-8', errors='replace')).hexdigest()
+    return hashes
+
+
+class LayoutCache:
+    """Node positions of named drawings, persisted in SQLite so renders are stable between runs.
+
+    A layout is reused as-is when the graph hash is unchanged. Otherwise,
+    nodes whose neighbourhood is unchanged keep their stored position and
+    are held fixed while the new or rewired nodes are placed around them;
+    new nodes start at the centroid of their already placed neighbours.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LAYOUT_CACHE_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS layouts (name TEXT PRIMARY KEY, graph_hash TEXT NOT NULL)")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS layout_positions (
+                name TEXT NOT NULL,
+                node TEXT NOT NULL,
+                x REAL NOT NULL,
+                y REAL NOT NULL,
+                neighborhood TEXT NOT NULL,
+                PRIMARY KEY (name, node)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _stored(self, name) -> dict:
+        rows = self.conn.execute("SELECT node, x, y, neighborhood FROM layout_positions WHERE name = ?", (name,))
+        return {node: ((x, y), neighborhood) for node, x, y, neighborhood in rows}
+
+    def layout(self, G, name: str, **layout_kwargs) -> dict:
+        """Positions of the nodes of `G` for the drawing called `name`; see `compute_layout` for the options."""
+        current_hash = graph_hash(G)
+        row = self.conn.execute("SELECT graph_hash FROM layouts WHERE name = ?", (name,)).fetchone()
+        stored = self._stored(name)
+        if row and row[0] == current_hash and len(stored) == len(G):
+            logger.info(f"Reusing the cached layout of '{name}'.")
+            return {node: stored[str(node)][0] for node in G}
+
+        hoods = neighborhood_hashes(G)
+        kept = {node: stored[str(node)][0] for node in G if str(node) in stored and stored[str(node)][1] == hoods[node]}
+        if not kept:
+            pos = compute_layout(G, **layout_kwargs)
+        elif len(kept) == len(G):
+            pos = kept
+        else:
+            initial = dict(kept)
+            for node in G:
+                if node not in initial:
+                    placed = [kept[v] for v in (*G.predecessors(node), *G.successors(node)) if v in kept] if G.is_directed() else [kept[v] for v in G.neighbors(node) if v in kept]
+                    if placed:
+                        initial[node] = (sum(x for x, _ in placed) / len(placed), sum(y for _, y in placed) / len(placed))
+            pos = compute_layout(G, initial=initial, fixed=list(kept), **layout_kwargs)
+            logger.info(f"Kept {len(kept)} of {len(G)} node positions of the cached layout of '{name}'.")
+
+        pos = {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+        self.conn.execute("DELETE FROM layout_positions WHERE name = ?", (name,))
+        self.conn.executemany(
+            "INSERT INTO layout_positions (name, node, x, y, neighborhood) VALUES (?, ?, ?, ?, ?)",
+            ((name, str(node), x, y, hoods[node]) for node, (x, y) in pos.items()),
+        )
+        self.conn.execute("INSERT OR REPLACE INTO layouts (name, graph_hash) VALUES (?, ?)", (name, current_hash))
+        self.conn.commit()
+        return pos
+
+    def clear(self):
+        self.conn.execute("DELETE FROM layout_positions")
+        self.conn.execute("DELETE FROM layouts")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def graph_layout(G, name: str, cache: LayoutCache | None = None, **layout_kwargs) -> dict:
+    """Layout of `G` from `cache` when one is given, computed afresh (but seeded, hence stable) otherwise."""
+    if cache is None:
+        return compute_layout(G, **layout_kwargs)
+    return cache.layout(G, name, **layout_kwargs)
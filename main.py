@@ -1,25 +1,133 @@
-from graph_builder import dependencies_digraph, dependencies_digraph_centrality
-from module_view_builder import module_view_digraph
-from churn_metrics import analyze_churn
-from module_view_builder2 import improved_module_view_digraph
+import argparse
+import logging
+import os
+from analysis_session import AnalysisSession
+from import_cache import DEFAULT_CACHE_PATH, ImportCache
+from module_trie import MATCH_POLICIES
+from centrality import CENTRALITY_MODES, CentralityEngine
+from incremental_graph import CHANGE_DETECTION_MODES
+from import_parser import SCANNERS
+from exports import EXPORT_FORMATS
+from layout_cache import DEFAULT_LAYOUT_CACHE_PATH
+from co_change import MAX_COMMIT_MODULES
+from file_utils import DISCOVERY_BACKENDS
+from rendering import FIGURE_FORMATS, MAX_RENDER_NODES, FigureRenderer, parse_figure_option
+import instrumentation
 
-def main():
-    CODE_ROOT_FOLDER = "./content/numpy/"
-    dependencies_digraph(CODE_ROOT_FOLDER)
-    print("Dependency graph generated and saved as 'dependency_graph.png'.")
 
-    dependencies_digraph_centrality(CODE_ROOT_FOLDER, top_n=25)
-    print("Dependency graph with centrality analysis generated and saved as 'dependency_graph_centrality.png'.")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dependency and churn analysis of a Python code base.")
+    parser.add_argument("code_root", nargs="?", default="./content/numpy/", help="Root folder of the code base to analyze.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite file caching parsed imports between runs.")
+    parser.add_argument("--no-cache", action="store_true", help="Parse every file without using the import cache.")
+    parser.add_argument("--invalidate-cache", action="store_true", help="Discard all cached imports before running.")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes used to parse files (0 = all cores).")
+    parser.add_argument("--match-policy", choices=MATCH_POLICIES, default="package", help="How import targets are matched against the project's modules.")
+    parser.add_argument("--churn-store", default=None, help="SQLite file keeping incremental churn totals; only new commits are read from git.")
+    parser.add_argument("--centrality", choices=CENTRALITY_MODES, default="exact", help="Betweenness algorithm: exact, sampled pivots, or exact split across --jobs processes.")
+    parser.add_argument("--centrality-k", type=int, default=256, help="Number of pivot sources in sampled mode.")
+    parser.add_argument("--centrality-seed", type=int, default=0, help="Random seed for choosing the sampled pivots.")
+    parser.add_argument("--incremental", choices=CHANGE_DETECTION_MODES, default=None, help="Update the graph stored in the cache, re-parsing only changed files (detected by mtime or git diff).")
+    parser.add_argument("--discovery", choices=DISCOVERY_BACKENDS, default="walk", help="How module files are found: a walk pruning excluded, .gitignore'd and virtualenv folders, or the files tracked by git.")
+    parser.add_argument("--scanner", choices=SCANNERS, default="ast", help="Import extraction: full AST, lexical scan of import statements, or lexical without function bodies.")
+    parser.add_argument("--module-depth", type=int, default=2, help="Package depth the module views aggregate files to (1 = top-level packages).")
+    parser.add_argument("--render", action="store_true", help="Draw the figures into ./img (matplotlib is only imported when set).")
+    parser.add_argument("--render-jobs", type=int, default=0, help="Worker processes drawing the figures concurrently (0 = all cores).")
+    parser.add_argument("--figure-format", nargs="+", choices=FIGURE_FORMATS, default=["png"], help="File formats every figure is saved in.")
+    parser.add_argument("--figure-dpi", type=int, default=None, help="Resolution of every figure (default: each figure's own).")
+    parser.add_argument("--figure", action="append", default=[], metavar="NAME=FORMATS@DPI", help="Formats and/or resolution of one figure, e.g. dependency_graph=svg or module_dependency_matrix=png,pdf@150; may be repeated.")
+    parser.add_argument("--render-max-nodes", type=int, default=MAX_RENDER_NODES, help="Graph figures with more nodes are reduced to their most central nodes before layout.")
+    parser.add_argument("--export", default=None, metavar="DIR", help="Write graphs and metrics as machine-readable files into DIR.")
+    parser.add_argument("--export-format", nargs="+", choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS), help="Graph file formats written by --export.")
+    parser.add_argument("--layout-cache", default=DEFAULT_LAYOUT_CACHE_PATH, help="SQLite file keeping node positions so figures stay stable between runs.")
+    parser.add_argument("--no-layout-cache", action="store_true", help="Compute every figure's layout from scratch.")
+    parser.add_argument("--co-change", default=None, metavar="SINCE", help="Also count which modules change together in commits since SINCE (a git --since expression) and flag pairs without an import between them.")
+    parser.add_argument("--co-change-top-k", type=int, default=None, help="Keep only the K most frequent pairs in a fixed-size sketch, for very long histories.")
+    parser.add_argument("--co-change-max-modules", type=int, default=MAX_COMMIT_MODULES, help="Ignore commits touching more modules than this when pairing.")
+    parser.add_argument("--churn-series", default=None, metavar="SINCE", help="Also bin per-module churn since SINCE into time buckets and save it as a NumPy array (into --export or ./img/churn_series).")
+    parser.add_argument("--churn-bucket-days", type=int, default=7, help="Width of the --churn-series buckets in days.")
+    parser.add_argument("--impact", nargs="+", default=None, metavar="PATH", help="Only print the modules affected by changes to these files (the changed modules and everything importing them, transitively), e.g. to select tests in CI.")
+    parser.add_argument("--profile", default=None, metavar="TRACE", help="Record per-stage timings, counters and peak memory and write them as a Chrome trace JSON file.")
+    parser.add_argument("--profile-stage", default=None, help="Also run this stage (e.g. parsing, centrality, rendering) under cProfile; stats go next to the trace.")
+    args = parser.parse_args(argv)
+    if args.module_depth < 1:
+        parser.error(f"--module-depth must be at least 1, got {args.module_depth}.")
+    return args
 
-    module_view_digraph(CODE_ROOT_FOLDER)
-    print("Module-level dependency graph generated and saved as 'module_dependency_graph.png'.")
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.render:
+        os.makedirs("./img", exist_ok=True)
+    if args.profile:
+        instrumentation.enable(args.profile_stage)
+    CODE_ROOT_FOLDER = args.code_root
+    cache_path = None if args.no_cache else args.cache
+    if cache_path and args.invalidate_cache:
+        with ImportCache(cache_path) as cache:
+            cache.clear()
+    renderer = None
+    if args.render:
+        try:
+            options = {name: (formats, dpi) for name, formats, dpi in map(parse_figure_option, args.figure)}
+        except ValueError as e:
+            raise SystemExit(f"error: {e}")
+        renderer = FigureRenderer(
+            jobs=args.render_jobs,
+            formats=args.figure_format,
+            dpi=args.figure_dpi,
+            options=options,
+            max_nodes=args.render_max_nodes,
+            layout_cache_path=None if args.no_layout_cache else args.layout_cache,
+        )
 
-    improved_module_view_digraph(CODE_ROOT_FOLDER)
-    print("Improved module-level dependency graph generated and saved as .png'.")
+    session = AnalysisSession(
+        CODE_ROOT_FOLDER,
+        cache_path=cache_path,
+        jobs=args.jobs,
+        match_policy=args.match_policy,
+        churn_store_path=args.churn_store,
+        centrality_engine=CentralityEngine(args.centrality, k=args.centrality_k, seed=args.centrality_seed, jobs=args.jobs),
+        incremental=args.incremental,
+        scanner=args.scanner,
+        module_depth=args.module_depth,
+        render=args.render,
+        export_dir=args.export,
+        export_formats=args.export_format,
+        layout_cache_path=None if args.no_layout_cache else args.layout_cache,
+        discovery=args.discovery,
+        renderer=renderer,
+    )
 
-    analyze_churn(CODE_ROOT_FOLDER, 25)
-    print("Churn analysis completed and saved as 'churn_analysis.png'.")
+    if args.impact:
+        impacted = session.impact(args.impact)
+    else:
+        session.dependency_graph()
+        session.centrality(top_n=25)
+        session.module_view()
+        session.improved_module_view()
+        session.churn(25)
+        if args.churn_series:
+            session.churn_series(args.churn_series, bucket_days=args.churn_bucket_days)
+        if args.co_change:
+            session.co_change(args.co_change, top_k=args.co_change_top_k, max_commit_modules=args.co_change_max_modules)
+        figures = session.render_figures()
+
+    recorder = instrumentation.disable()
+    if recorder is not None:
+        recorder.write_trace(args.profile)
+        for stage, stats in sorted(recorder.summary()["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"{stage:<20}{stats['seconds']:>9.3f}s  {stats['calls']:>4} calls  {stats['counters']}")
+
+    if args.impact:
+        for module in sorted(impacted):
+            print(module)
+    if args.render and not args.impact:
+        paths = [os.path.basename(path) for name in sorted(figures) for path in figures[name]]
+        print(f"Figures saved in ./img: {', '.join(paths)}.")
+    if args.export:
+        print(f"Graphs and metrics exported to '{args.export}'.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
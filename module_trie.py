@@ -0,0 +1,57 @@
+MATCH_POLICIES = ("exact", "prefix", "package")
+
+_END = ""
+
+
+class ModuleTrie:
+    """Dotted-name trie over a set of module names.
+
+    Every membership test walks at most one node per name component, whatever
+    the number of modules. Three matching policies are supported:
+
+    - "exact":   the name is one of the modules.
+    - "prefix":  the name is one of the modules or lives below one of them,
+                 on a dotted boundary ("a.b" matches "a.b.c" but not "a.bc").
+    - "package": the name shares its top-level package with one of the modules.
+    """
+
+    def __init__(self, modules=()):
+        self.root = {}
+        for module in modules:
+            self.add(module)
+
+    def add(self, module: str):
+        node = self.root
+        for part in module.split("."):
+            node = node.setdefault(part, {})
+        node[_END] = True
+
+    def contains(self, name: str) -> bool:
+        node = self.root
+        for part in name.split("."):
+            node = node.get(part)
+            if node is None:
+                return False
+        return _END in node
+
+    def has_prefix_of(self, name: str) -> bool:
+        node = self.root
+        for part in name.split("."):
+            node = node.get(part)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+    def shares_package_with(self, name: str) -> bool:
+        return name.split(".", 1)[0] in self.root
+
+    def matches(self, name: str, policy: str = "package") -> bool:
+        if policy == "exact":
+            return self.contains(name)
+        if policy == "prefix":
+            return self.has_prefix_of(name)
+        if policy == "package":
+            return self.shares_package_with(name)
+        raise ValueError(f"Unknown match policy '{policy}', expected one of {MATCH_POLICIES}.")
@@ -1,47 +1,46 @@
 import networkx as nx
-import matplotlib.pyplot as plt
-from graph_builder import dependencies_digraph
+from graph_builder import build_dependency_graph
+from centrality import CentralityEngine
+import instrumentation
+from hierarchy_rollup import HierarchyRollup
+from layout_cache import graph_layout
+from sparse_graph import graph_from_sparse
+from rendering import save_figure
 
-def module_view_digraph(code_root_folder):
-    """Build a directed module-level dependency graph for NumPy, with centrality analysis and visualization."""
-    G = dependencies_digraph(code_root_folder)
-    file_to_module = {}
-    for node in G.nodes:
-        parts = node.split('.')
-        if len(parts) >= 2 and parts[0] == 'numpy':
-            module = 'numpy.' + parts[1] 
-            file_to_module[node] = module
-        else:
-            file_to_module[node] = 'numpy.misc' 
-    
-    module_graph = nx.DiGraph()
-    modules = set(file_to_module.values())
-    module_graph.add_nodes_from(modules)
-    
-    for source_file, target_file in G.edges:
-        source_module = file_to_module[source_file]
-        target_module = file_to_module[target_file]
-        if source_module != target_module:
-            if module_graph.has_edge(source_module, target_module):
-                module_graph[source_module][target_module]['weight'] += 1
-            else:
-                module_graph.add_edge(source_module, target_module, weight=1)
+def module_view_digraph(code_root_folder, cache_path=None):
+    """Build a directed module-level dependency graph for a code base, with centrality analysis and visualization."""
+    G = build_dependency_graph(code_root_folder, cache_path=cache_path)
+    return module_view_from_graph(G, draw=True)
+
+def module_view_from_graph(G, engine=None, depth=2, rollup=None, draw=False, layout_cache=None, renderer=None):
+    """Roll an already built file-level graph up to its packages at `depth`, drawing it when `draw` is set or queueing it on a FigureRenderer.
+
+    A `HierarchyRollup` built once for the graph can be passed in to reuse it across views.
+    """
+    rollup = rollup or HierarchyRollup(G, max_depth=depth)
+    M, modules = rollup.matrix(depth)
+    module_graph = graph_from_sparse(M, modules)
     
     in_degree = dict(module_graph.in_degree(weight='weight'))
     out_degree = dict(module_graph.out_degree(weight='weight'))
-    betweenness = nx.betweenness_centrality(module_graph, weight='weight')
+    betweenness = (engine or CentralityEngine()).betweenness(module_graph, weight='weight')
     
     in_degree_nonzero = {k: v for k, v in in_degree.items() if v > 0}
     out_degree_nonzero = {k: v for k, v in out_degree.items() if v > 0}
     betweenness_nonzero = {k: v for k, v in betweenness.items() if v > 0}
     
-    draw_module_graph(module_graph, in_degree_nonzero, out_degree_nonzero, betweenness_nonzero)
+    if renderer is not None:
+        renderer.submit("module_dependency_graph", module_graph, in_degree_nonzero, out_degree_nonzero, betweenness_nonzero, scores=betweenness)
+    elif draw:
+        draw_module_graph(module_graph, in_degree_nonzero, out_degree_nonzero, betweenness_nonzero, layout_cache=layout_cache)
     
     return module_graph
 
-def draw_module_graph(G, in_degree, out_degree, betweenness):
+@instrumentation.timed("rendering")
+def draw_module_graph(G, in_degree, out_degree, betweenness, layout_cache=None, labels=None, output_file="./img/module_dependency_graph.png", dpi=300, formats=None):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(20, 20))
-    pos = nx.spring_layout(G)
+    pos = graph_layout(G, "module_dependency_graph", cache=layout_cache)
     
     node_sizes = [in_degree.get(node, 0) * 1000 for node in G.nodes()]
     
@@ -53,6 +52,7 @@ def draw_module_graph(G, in_degree, out_degree, betweenness):
     nx.draw(
         G, pos,
         with_labels=True,
+        labels=labels,
         node_size=node_sizes,
         node_color=node_colors,
         cmap=plt.cm.Reds,
@@ -63,6 +63,5 @@ def draw_module_graph(G, in_degree, out_degree, betweenness):
         alpha=0.7
     )
     
-    plt.savefig("./img/module_dependency_graph.png", dpi=300, bbox_inches='tight')
-    plt.close()
+    return save_figure(output_file, dpi, formats, bbox_inches='tight')
 
@@ -1,44 +1,34 @@
 import networkx as nx
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 import numpy as np
 from collections import defaultdict
-from graph_builder import dependencies_digraph
+from graph_builder import build_dependency_graph
+from centrality import CentralityEngine
+import instrumentation
+from hierarchy_rollup import HierarchyRollup
+from layout_cache import graph_layout
+from sparse_graph import graph_from_sparse, to_sparse_adjacency
+from rendering import save_figure
 
 
-def improved_module_view_digraph(code_root_folder):
-    G = dependencies_digraph(code_root_folder)
-    file_to_module = {}
-    for node in G.nodes:
-        parts = node.split('.')
-        if len(parts) >= 2 and parts[0] == 'numpy':
-            module = 'numpy.' + parts[1]
-            file_to_module[node] = module
-        else:
-            file_to_module[node] = 'numpy.misc'
-   
-    module_graph = nx.DiGraph()
-    modules = set(file_to_module.values())
-    module_graph.add_nodes_from(modules)
-   
-    for source_file, target_file in G.edges:
-        source_module = file_to_module[source_file]
-        target_module = file_to_module[target_file]
-        if source_module != target_module:
-            if module_graph.has_edge(source_module, target_module):
-                module_graph[source_module][target_module]['weight'] += 1
-            else:
-                module_graph.add_edge(source_module, target_module, weight=1)
+def improved_module_view_digraph(code_root_folder, cache_path=None):
+    G = build_dependency_graph(code_root_folder, cache_path=cache_path)
+    return improved_module_view_from_graph(G, draw=True)
+
+def improved_module_view_from_graph(G, engine=None, depth=2, rollup=None, draw=False, layout_cache=None, renderer=None):
+    """Roll an already built file-level graph up to its packages at `depth` and drop weak edges, drawing it when `draw` is set or queueing it on a FigureRenderer."""
+    rollup = rollup or HierarchyRollup(G, max_depth=depth)
+    M, modules = rollup.matrix(depth)
+    module_graph = graph_from_sparse(M, modules)
     
     in_degree = dict(module_graph.in_degree(weight='weight'))
     out_degree = dict(module_graph.out_degree(weight='weight'))
-    betweenness = nx.betweenness_centrality(module_graph, weight='weight')
+    betweenness = (engine or CentralityEngine()).betweenness(module_graph, weight='weight')
     
     filtered_graph = nx.DiGraph()
     filtered_graph.add_nodes_from(module_graph.nodes())
     
     edge_weights = [module_graph[u][v]['weight'] for u, v in module_graph.edges()]
-    weight_threshold = np.percentile(edge_weights, 50)  
+    weight_threshold = np.percentile(edge_weights, 50) if edge_weights else 0
     
     for u, v, data in module_graph.edges(data=True):
         if data['weight'] > weight_threshold:
@@ -48,17 +38,23 @@ def improved_module_view_digraph(code_root_folder):
     print(f"Filtered graph: {len(filtered_graph.edges())} edges")
     print(f"Weight threshold: {weight_threshold}")
     
-    draw_improved_module_graph(filtered_graph, in_degree, out_degree, betweenness)
-    
-    draw_dependency_matrix(module_graph)
+    if renderer is not None:
+        renderer.submit("improved_module_dependency_graph", filtered_graph, in_degree, out_degree, betweenness, scores=betweenness)
+        renderer.submit("module_dependency_matrix", M, modules)
+    elif draw:
+        draw_improved_module_graph(filtered_graph, in_degree, out_degree, betweenness, layout_cache=layout_cache)
+        draw_sparse_dependency_matrix(M, modules)
     
     return filtered_graph
 
-def draw_improved_module_graph(G, in_degree, out_degree, betweenness):
-    """Draw a more readable module graph."""
+@instrumentation.timed("rendering")
+def draw_improved_module_graph(G, in_degree, out_degree, betweenness, layout_cache=None, labels=None, output_file="./img/improved_module_dependency_graph.png", dpi=300, formats=None):
+    """Draw a more readable module graph; with `labels`, only those nodes are labelled."""
+    import matplotlib.colors as mcolors
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(16, 12), dpi=300)
     
-    pos = nx.spring_layout(G, k=0.3, iterations=50)  
+    pos = graph_layout(G, "improved_module_dependency_graph", cache=layout_cache, k=0.3, iterations=50)
     
     module_types = defaultdict(list)
     for node in G.nodes():
@@ -96,9 +92,11 @@ def draw_improved_module_graph(G, in_degree, out_degree, betweenness):
         edge_color="dimgray"
     )
     
-    labels = {node: node.split('.')[-1] for node in G.nodes()}
+    labels = {node: node.split('.')[-1] for node in G.nodes() if labels is None or node in labels}
     
     for node, (x, y) in pos.items():
+        if node not in labels:
+            continue
         plt.text(
             x, y, labels[node],
             fontsize=10,
@@ -113,24 +111,24 @@ def draw_improved_module_graph(G, in_degree, out_degree, betweenness):
                 fontsize=10, ha='left')
     
     plt.tight_layout()
-    plt.savefig("./img/improved_module_dependency_graph.png", dpi=300, bbox_inches='tight')
-    plt.close()
+    return save_figure(output_file, dpi, formats, bbox_inches='tight')
 
 def draw_dependency_matrix(G, output_file="./img/module_dependency_matrix.png"):
     """Create a dependency matrix visualization that's great for reports."""
-    modules = sorted(list(G.nodes()))
+    matrix, modules = to_sparse_adjacency(G, weight='weight')
+    draw_sparse_dependency_matrix(matrix, modules, output_file)
+
+@instrumentation.timed("rendering")
+def draw_sparse_dependency_matrix(matrix, modules, output_file="./img/module_dependency_matrix.png", dpi=300, formats=None):
+    """Draw a module dependency matrix from a sparse adjacency matrix and its row labels."""
+    import matplotlib.pyplot as plt
     n = len(modules)
-    
-    matrix = np.zeros((n, n))
-    for i, source in enumerate(modules):
-        for j, target in enumerate(modules):
-            if G.has_edge(source, target):
-                matrix[i, j] = G[source][target]['weight']
+    matrix = matrix.tocoo()
     
     fig, ax = plt.subplots(figsize=(12, 10), dpi=300)
     
     cmap = plt.cm.Blues
-    im = ax.imshow(matrix, cmap=cmap)
+    im = ax.imshow(matrix.toarray().astype(np.float32), cmap=cmap)
     
     tick_labels = [mod.split('.')[-1] for mod in modules]
     
@@ -139,13 +137,15 @@ def draw_dependency_matrix(G, output_file="./img/module_dependency_matrix.png"):
     ax.set_xticklabels(tick_labels, rotation=45, ha='right', fontsize=8)
     ax.set_yticklabels(tick_labels, fontsize=8)
     
-    threshold = np.percentile(matrix[matrix > 0], 75)  
-    for i in range(n):
-        for j in range(n):
-            if matrix[i, j] > threshold:
-                ax.text(j, i, int(matrix[i, j]),
+    values = matrix.data[matrix.data > 0]
+    if values.size:
+        threshold = np.percentile(values, 75)
+        max_value = values.max()
+        for i, j, value in zip(matrix.row, matrix.col, matrix.data):
+            if value > threshold:
+                ax.text(j, i, int(value),
                         ha="center", va="center", 
-                        color="white" if matrix[i, j] > np.max(matrix)/2 else "black",
+                        color="white" if value > max_value/2 else "black",
                         fontsize=7)
     
     cbar = fig.colorbar(im)
@@ -154,5 +154,4 @@ def draw_dependency_matrix(G, output_file="./img/module_dependency_matrix.png"):
     plt.title("NumPy Module Dependency Matrix", fontsize=14)
     plt.tight_layout()
     
-    plt.savefig(output_file, bbox_inches='tight')
-    plt.close()
\ No newline at end of file
+    return save_figure(output_file, dpi, formats, bbox_inches='tight')
@@ -0,0 +1,208 @@
+import json
+import logging
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+
+import instrumentation
+from compact_graph import CompactGraph
+from layout_cache import graph_hash
+
+logger = logging.getLogger(__name__)
+
+
+def _topological_order(indptr, indices, n) -> list[int]:
+    """Kahn's algorithm over a DAG in CSR form."""
+    in_degree = np.bincount(indices, minlength=n).tolist()
+    order = [c for c in range(n) if in_degree[c] == 0]
+    indptr, indices = indptr.tolist(), indices.tolist()
+    for c in order:
+        for s in indices[indptr[c]:indptr[c + 1]]:
+            in_degree[s] -= 1
+            if in_degree[s] == 0:
+                order.append(s)
+    return order
+
+def _closure(indptr, indices, order, words) -> np.ndarray:
+    """Bitset rows of the components reachable from each component through at least one edge, filled in reverse topological order."""
+    n = len(order)
+    bits = np.zeros((n, words), dtype=np.uint64)
+    for c in reversed(order):
+        successors = indices[indptr[c]:indptr[c + 1]]
+        if len(successors):
+            row = np.bitwise_or.reduce(bits[successors], axis=0)
+            np.bitwise_or.at(row, successors >> 6, np.left_shift(np.uint64(1), (successors & 63).astype(np.uint64)))
+            bits[c] = row
+    return bits
+
+
+class ReachabilityIndex:
+    """Transitive dependency queries answered from a precomputed closure.
+
+    The graph is condensed into its strongly connected components (import
+    cycles), and for every component of the condensation DAG two bitsets
+    record the components it reaches and the components that reach it. A
+    `depends_on` test is then one bit lookup and `ancestors` /
+    `descendants` cost one row scan, whatever the path lengths. The bitsets
+    take 2 * C^2 / 8 bytes for C components.
+    """
+
+    def __init__(self, names, components, cyclic, descendant_bits, ancestor_bits):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.components = np.asarray(components, dtype=np.int64)
+        self.descendant_bits = descendant_bits
+        self.ancestor_bits = ancestor_bits
+        self.n_components = descendant_bits.shape[0]
+        self._members = np.argsort(self.components, kind='stable')
+        self._starts = np.zeros(self.n_components + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.components, minlength=self.n_components), out=self._starts[1:])
+        self._cyclic = np.asarray(cyclic, dtype=bool)
+
+    @classmethod
+    @instrumentation.timed("reachability")
+    def build(cls, G) -> "ReachabilityIndex":
+        """Index a networkx graph or a CompactGraph."""
+        if not isinstance(G, CompactGraph):
+            G = CompactGraph.from_networkx(G)
+        A = G.adjacency()
+        n_components, components = connected_components(A, directed=True, connection='strong')
+        sources = np.repeat(np.arange(len(G)), np.diff(G.indptr))
+        cu, cv = components[sources], components[G.indices]
+        between = cu != cv
+        words = max(1, -(-n_components // 64))
+        condensed = CompactGraph.from_edges(range(n_components), cu[between], cv[between])
+        order = _topological_order(condensed.indptr, condensed.indices, n_components)
+        descendant_bits = _closure(condensed.indptr, condensed.indices.astype(np.int64), order, words)
+        reverse = condensed.adjacency().T.tocsr()
+        ancestor_bits = _closure(reverse.indptr, reverse.indices.astype(np.int64), order[::-1], words)
+        cyclic = np.bincount(components, minlength=n_components) > 1
+        # A self-import is a cycle of one module.
+        cyclic[components[sources[sources == G.indices]]] = True
+        logger.info(f"Reachability index over {len(G)} modules in {n_components} strongly connected components.")
+        return cls(G.names, components, cyclic, descendant_bits, ancestor_bits)
+
+    def _component(self, module) -> int:
+        i = self.ids.get(module)
+        if i is None:
+            raise KeyError(f"Module '{module}' is not in the dependency graph.")
+        return int(self.components[i])
+
+    def _expand(self, row) -> set:
+        """Modules of the components whose bit is set in `row`."""
+        components = np.flatnonzero(np.unpackbits(row.astype('<u8').view(np.uint8), bitorder='little')[:self.n_components])
+        members = [self._members[self._starts[c]:self._starts[c + 1]] for c in components.tolist()]
+        if not members:
+            return set()
+        names = self.names
+        return {names[i] for i in np.concatenate(members).tolist()}
+
+    def cycle(self, module) -> set:
+        """Modules in an import cycle with `module` (including itself), or an empty set."""
+        c = self._component(module)
+        if not self._cyclic[c]:
+            return set()
+        return {self.names[i] for i in self._members[self._starts[c]:self._starts[c + 1]].tolist()}
+
+    def in_cycle(self, module) -> bool:
+        return bool(self._cyclic[self._component(module)])
+
+    def depends_on(self, module, other) -> bool:
+        """Whether `module` imports `other`, directly or transitively."""
+        a, b = self._component(module), self._component(other)
+        if a == b:
+            return bool(self._cyclic[a])
+        return bool((int(self.descendant_bits[a, b >> 6]) >> (b & 63)) & 1)
+
+    def _related(self, module, bits) -> set:
+        c = self._component(module)
+        related = self._expand(bits[c])
+        if self._cyclic[c]:
+            related |= self.cycle(module) - {module}
+        return related
+
+    def descendants(self, module) -> set:
+        """Modules that `module` depends on, like `nx.descendants`."""
+        return self._related(module, self.descendant_bits)
+
+    def ancestors(self, module) -> set:
+        """Modules that depend on `module`, like `nx.ancestors`."""
+        return self._related(module, self.ancestor_bits)
+
+    def impacted(self, modules) -> set:
+        """The given modules plus every module depending on any of them, e.g. the tests to rerun for a change.
+
+        Modules absent from the graph (files without any import edge) only impact themselves.
+        """
+        modules = set(modules)
+        known = [self.ids[module] for module in modules if module in self.ids]
+        if not known:
+            return modules
+        components = np.unique(self.components[known])
+        row = np.bitwise_or.reduce(self.ancestor_bits[components], axis=0)
+        np.bitwise_or.at(row, components >> 6, np.left_shift(np.uint64(1), (components & 63).astype(np.uint64)))
+        return modules | self._expand(row)
+
+
+class ReachabilityStore:
+    """The reachability index of the latest graph, persisted in SQLite (by default next to the graph in the import cache).
+
+    The index is rebuilt only when the graph hash changes.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reachability (
+                graph_hash TEXT PRIMARY KEY,
+                names TEXT NOT NULL,
+                n_components INTEGER NOT NULL,
+                components BLOB NOT NULL,
+                cyclic BLOB NOT NULL,
+                descendant_bits BLOB NOT NULL,
+                ancestor_bits BLOB NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def index(self, G) -> ReachabilityIndex:
+        current_hash = graph_hash(G)
+        row = self.conn.execute(
+            "SELECT names, n_components, components, cyclic, descendant_bits, ancestor_bits FROM reachability WHERE graph_hash = ?",
+            (current_hash,),
+        ).fetchone()
+        if row is not None:
+            names, n_components, components, cyclic, descendant_bits, ancestor_bits = row
+            words = max(1, -(-n_components // 64))
+            logger.info("Reusing the stored reachability index.")
+            return ReachabilityIndex(
+                json.loads(names),
+                np.frombuffer(components, dtype=np.int64),
+                np.frombuffer(cyclic, dtype=bool),
+                np.frombuffer(descendant_bits, dtype=np.uint64).reshape(n_components, words),
+                np.frombuffer(ancestor_bits, dtype=np.uint64).reshape(n_components, words),
+            )
+
+        index = ReachabilityIndex.build(G)
+        self.conn.execute("DELETE FROM reachability")
+        self.conn.execute(
+            "INSERT INTO reachability (graph_hash, names, n_components, components, cyclic, descendant_bits, ancestor_bits) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (current_hash, json.dumps(index.names), index.n_components, index.components.tobytes(), index._cyclic.tobytes(), index.descendant_bits.tobytes(), index.ancestor_bits.tobytes()),
+        )
+        self.conn.commit()
+        return index
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,193 @@
+import importlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+from centrality import top_n_items
+from compact_graph import CompactGraph
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIGURE_DIR = "./img"
+
+# Graph figures with more nodes than this are reduced to their most central nodes before layout.
+MAX_RENDER_NODES = 400
+
+# Only this many nodes of a graph figure get a label; the others are drawn unlabelled.
+MAX_LABELS = 150
+
+FIGURE_FORMATS = ("png", "svg", "pdf")
+
+# Name (and output file stem) of every figure: the module and function drawing it, and what it is.
+# "graph" figures take a layout cache and labels and are reduced when too large;
+# "plot" figures take neither.
+FIGURES = {
+    "dependency_graph": ("graph_builder", "draw_graph", "graph"),
+    "dependency_graph_emphasized": ("graph_builder", "draw_graph_centrality", "graph"),
+    "dependency_graph_centrality": ("graph_builder", "draw_graph_centrality_barplot", "plot"),
+    "module_dependency_graph": ("module_view_builder", "draw_module_graph", "graph"),
+    "improved_module_dependency_graph": ("module_view_builder2", "draw_improved_module_graph", "graph"),
+    "module_dependency_matrix": ("module_view_builder2", "draw_sparse_dependency_matrix", "plot"),
+    "churn_analysis": ("churn_metrics", "draw_churn", "plot"),
+    "churn_series": ("churn_series", "draw_churn_series", "plot"),
+}
+
+
+def save_figure(output_file: str, dpi=None, formats=None, **savefig_kwargs) -> list[str]:
+    """Save the current matplotlib figure as `output_file`, or once per extension in `formats`, and close it.
+
+    Returns the paths written. With `dpi` None the figure's own resolution is used.
+    """
+    import matplotlib.pyplot as plt
+    stem, _ = os.path.splitext(output_file)
+    paths = [f"{stem}.{fmt}" for fmt in formats] if formats else [output_file]
+    os.makedirs(os.path.dirname(output_file) or os.curdir, exist_ok=True)
+    for path in paths:
+        plt.savefig(path, dpi=dpi, **savefig_kwargs)
+    plt.close()
+    return paths
+
+def parse_figure_option(option: str) -> tuple[str, list[str] | None, int | None]:
+    """Split a `NAME=FORMAT[,FORMAT...][@DPI]` option (e.g. `dependency_graph=svg`, `module_dependency_matrix=png,pdf@150`, `churn_analysis=@72`)."""
+    name, _, value = option.partition("=")
+    if name not in FIGURES:
+        raise ValueError(f"Unknown figure '{name}', expected one of {list(FIGURES)}.")
+    formats, _, dpi = value.partition("@")
+    formats = [fmt for fmt in formats.split(",") if fmt] or None
+    for fmt in formats or ():
+        if fmt not in FIGURE_FORMATS:
+            raise ValueError(f"Unknown figure format '{fmt}', expected one of {FIGURE_FORMATS}.")
+    try:
+        return name, formats, int(dpi) if dpi else None
+    except ValueError:
+        raise ValueError(f"Figure resolution '{dpi}' of '{name}' is not an integer.")
+
+def reduce_graph(G, max_nodes: int, scores=None):
+    """Subgraph of `G` on its `max_nodes` highest scoring nodes (total degree by default), in G's node order."""
+    scores = scores or dict(G.degree())
+    kept = {node for node, _ in top_n_items({node: scores.get(node, 0) for node in G}, max_nodes)}
+    if isinstance(G, CompactGraph):
+        return G.subgraph(kept)
+    H = G.__class__()
+    H.add_nodes_from(node for node in G if node in kept)
+    H.add_edges_from((u, v, data) for u, v, data in G.edges(data=True) if u in kept and v in kept)
+    return H
+
+def culled_labels(G, max_labels: int, scores=None) -> dict | None:
+    """Labels of the `max_labels` highest scoring nodes of `G`, or None (label everything) for smaller graphs."""
+    if len(G) <= max_labels:
+        return None
+    scores = scores or dict(G.degree())
+    return {node: node for node, _ in top_n_items({node: scores.get(node, 0) for node in G}, max_labels)}
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+def _render(job):
+    """Draw one queued figure; runs in a worker process (or inline with one job)."""
+    name, args, kwargs, layout_cache_path = job
+    module_name, function_name, kind = FIGURES[name]
+    draw = getattr(importlib.import_module(module_name), function_name)
+    start = time.perf_counter()
+    if kind != "plot" and layout_cache_path:
+        from layout_cache import LayoutCache
+        with LayoutCache(layout_cache_path) as layout_cache:
+            paths = draw(*args, layout_cache=layout_cache, **kwargs)
+    else:
+        paths = draw(*args, **kwargs)
+    return paths, time.perf_counter() - start
+
+
+class FigureRenderer:
+    """Queue of figures drawn together, concurrently, once every analysis stage has run.
+
+    Stages `submit` a figure with the graph and metrics it shows; `render`
+    then draws the queue on a process pool of `jobs` workers with the Agg
+    backend (all cores when None, inline when 1). Graph figures with more
+    than `max_nodes` nodes are reduced to the most central ones before
+    layout and only `max_labels` nodes are labelled; a CompactGraph is
+    reduced first and only what is drawn becomes a networkx graph.
+    `formats` and `dpi` apply to every figure, `options` (`{name: (formats,
+    dpi)}`) override them per figure; a None resolution keeps the figure's
+    default.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = DEFAULT_FIGURE_DIR,
+        jobs: int | None = None,
+        formats=("png",),
+        dpi: int | None = None,
+        options: dict | None = None,
+        max_nodes: int = MAX_RENDER_NODES,
+        max_labels: int = MAX_LABELS,
+        layout_cache_path: str | None = None,
+    ):
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.formats = list(formats)
+        self.dpi = dpi
+        self.options = options or {}
+        self.max_nodes = max_nodes
+        self.max_labels = max_labels
+        self.layout_cache_path = layout_cache_path
+        self.queue = []
+
+    def submit(self, name: str, *args, scores=None, **kwargs):
+        """Queue figure `name` (see FIGURES) drawn from `args`; `scores` rank the nodes of graph figures when reducing and labelling."""
+        if name not in FIGURES:
+            raise ValueError(f"Unknown figure '{name}', expected one of {list(FIGURES)}.")
+        if FIGURES[name][2] == "graph":
+            G = args[0]
+            if len(G) > self.max_nodes:
+                logger.info(f"Reducing '{name}' from {len(G)} to its {self.max_nodes} most central nodes.")
+                G = reduce_graph(G, self.max_nodes, scores)
+            if isinstance(G, CompactGraph):
+                G = G.to_networkx()
+            args = (G, *args[1:])
+            kwargs["labels"] = culled_labels(G, self.max_labels, scores)
+        formats, dpi = self.options.get(name, (None, None))
+        dpi = dpi or self.dpi
+        if dpi is not None:
+            kwargs["dpi"] = dpi
+        kwargs["formats"] = formats or self.formats
+        kwargs["output_file"] = os.path.join(self.output_dir, f"{name}.png")
+        self.queue.append((name, args, kwargs, self.layout_cache_path))
+
+    @instrumentation.timed("figures")
+    def render(self) -> dict:
+        """Draw and empty the queue; returns `{name: [paths written]}`. A failing figure is logged and skipped."""
+        queue, self.queue = self.queue, []
+        if not queue:
+            return {}
+        if self.layout_cache_path:
+            from layout_cache import LayoutCache
+            # Create the tables once, before the workers open the file concurrently.
+            LayoutCache(self.layout_cache_path).close()
+        jobs = min(self.jobs or os.cpu_count() or 1, len(queue))
+        written = {}
+        if jobs == 1:
+            _init_worker()
+            outcomes = []
+            for job in queue:
+                try:
+                    outcomes.append(_render(job))
+                except Exception as e:
+                    outcomes.append(e)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+                futures = [pool.submit(_render, job) for job in queue]
+                outcomes = [future.exception() or future.result() for future in futures]
+        for (name, _, _, _), outcome in zip(queue, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(f"Rendering '{name}' failed: {outcome}")
+                continue
+            paths, seconds = outcome
+            written[name] = paths or []
+            logger.info(f"Rendered '{name}' in {seconds:.2f}s.")
+        logger.info(f"Rendered {len(written)} of {len(queue)} figures with {jobs} worker{'s' if jobs > 1 else ''}.")
+        return written
@@ -0,0 +1,54 @@
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+
+def to_sparse_adjacency(G, nodelist=None, weight=None):
+    """Integer-code the nodes of `G` and return its adjacency as a CSR matrix plus the label array.
+
+    Row `i` / column `j` holds the weight of the edge `labels[i] -> labels[j]`
+    (1 when `weight` is None or the edge has no such attribute). Nodes are
+    coded in `nodelist` order, or in sorted order by default.
+    """
+    labels = np.array(sorted(G) if nodelist is None else list(nodelist), dtype=object)
+    codes = {node: i for i, node in enumerate(labels)}
+    n = len(labels)
+    edges = [(u, v, d) for u, v, d in G.edges(data=True) if u in codes and v in codes]
+    rows = np.fromiter((codes[u] for u, _, _ in edges), dtype=np.int64, count=len(edges))
+    cols = np.fromiter((codes[v] for _, v, _ in edges), dtype=np.int64, count=len(edges))
+    if weight is None:
+        data = np.ones(len(edges))
+    else:
+        data = np.fromiter((d.get(weight, 1) for _, _, d in edges), dtype=float, count=len(edges))
+    A = sp.csr_matrix((data, (rows, cols)), shape=(n, n))
+    if not G.is_directed():
+        A = A + sp.triu(A, k=1).T + sp.tril(A, k=-1).T
+    return A.tocsr(), labels
+
+def rollup_adjacency(A, groups, keep_self_loops=False):
+    """Aggregate a node adjacency matrix into a group adjacency matrix as P^T A P.
+
+    `groups` holds the group label of every row of `A`. Returns the CSR group
+    matrix, whose entries count (or sum the weights of) the edges between two
+    groups, and the sorted group labels. Edges inside a group are dropped
+    unless `keep_self_loops` is set.
+    """
+    group_labels, membership = np.unique(np.asarray(groups, dtype=object), return_inverse=True)
+    n = A.shape[0]
+    P = sp.csr_matrix((np.ones(n), (np.arange(n), membership)), shape=(n, len(group_labels)))
+    M = (P.T @ A @ P).tocsr()
+    if not keep_self_loops:
+        M.setdiag(0)
+        M.eliminate_zeros()
+    return M, group_labels
+
+def graph_from_sparse(M, labels, weight="weight"):
+    """Directed graph with a node per label and a weighted edge per nonzero entry of `M`."""
+    G = nx.DiGraph()
+    G.add_nodes_from(labels)
+    coo = M.tocoo()
+    values = coo.data.tolist()
+    if np.issubdtype(coo.data.dtype, np.floating) and all(value.is_integer() for value in values):
+        values = [int(value) for value in values]
+    G.add_edges_from((labels[i], labels[j], {weight: w}) for i, j, w in zip(coo.row.tolist(), coo.col.tolist(), values))
+    return G
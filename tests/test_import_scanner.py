@@ -0,0 +1,57 @@
+import textwrap
+
+import pytest
+
+from import_parser import extract_imports
+from import_scanner import scan_import_statements
+
+SOURCES = {
+    "continuation": r"""
+        from scipy.optimize._trustregion_constr \
+            import projections, orthogonality
+        import os, \
+            sys
+        from .base import \
+            helper
+    """,
+    "parenthesized": """
+        from collections import (
+            OrderedDict,  # import json
+            defaultdict as dd,
+        )
+        from . import (a,
+                       b)
+    """,
+    "semicolons": """
+        import os; import sys as system; from .. import sibling
+        x = 1; from json import dumps
+        if True: import re
+    """,
+    "mixed": '''
+        """import not_an_import"""
+        try:
+            import numpy as np
+        except ImportError:  # import nothing
+            np = None
+
+        def load():
+            from pkg.sub \\
+                import loader; import pickle
+            return loader
+    ''',
+}
+
+
+@pytest.mark.parametrize("name", sorted(SOURCES))
+def test_lexical_scan_matches_ast(name):
+    source = textwrap.dedent(SOURCES[name]).encode()
+    assert extract_imports(source, "pkg.sub.mod", scanner="lexical") == extract_imports(source, "pkg.sub.mod", scanner="ast")
+
+
+def test_continuation_line_is_not_a_statement():
+    source = textwrap.dedent(SOURCES["continuation"]).encode()
+    assert list(scan_import_statements(source)) == [
+        ("from", 0, "scipy.optimize._trustregion_constr", ["projections", "orthogonality"]),
+        ("import", ["os", "sys"]),
+        ("from", 1, "base", ["helper"]),
+    ]
@@ -0,0 +1,35 @@
+import subprocess
+
+from graph_builder import build_dependency_graph
+from incremental_graph import IncrementalGraph
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def test_git_update_with_root_in_subdirectory(tmp_path):
+    root = tmp_path / "src"
+    package = root / "pkg"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "a.py").write_text("")
+    (package / "b.py").write_text("import pkg.a\n")
+    (package / "c.py").write_text("import pkg.b\n")
+    (tmp_path / "README").write_text("")
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "initial")
+
+    cache_path = str(tmp_path / "cache.sqlite")
+    with IncrementalGraph(str(root), cache_path) as store:
+        store.update("git")
+
+    (package / "c.py").write_text("import pkg.b\nimport pkg.a\n")
+    with IncrementalGraph(str(root), cache_path) as store:
+        delta = store.update("git")
+        graph = store.graph
+
+    assert delta.changed_files == {"pkg/c.py"}
+    assert ("pkg.c", "pkg.a") in delta.added_edges
+    assert set(graph.edges()) == set(build_dependency_graph(str(root)).edges())